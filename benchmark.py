@@ -0,0 +1,128 @@
+'''
+Benchmark of the multi-modal transportation model on synthetic instances (see generate_instance), for the DOCPLEX
+and CVXPY frameworks. For each framework, records wall time, peak resident memory, variable and constraint counts,
+objective value and MIP gap of each phase and writes them to a JSON file, so that runs can be compared, e.g.
+
+    python benchmark.py --cities 6 --ports 4 --days 30 --goods 20 --solver HIGHS --output results.json
+
+Each framework runs in its own process, so that peak memory is measured separately. With --window, the instance is
+solved over a rolling horizon instead, and the size and time of every window are recorded, e.g. to check that they
+follow the window length rather than the horizon:
+
+    python benchmark.py --days 60 --goods 30 --solver HIGHS --frameworks CVXPY --window 7
+'''
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# the model script is loaded by path, as its file name is not a module name
+spec = importlib.util.spec_from_file_location(
+    'mmt', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'multi-modal transportation.py'))
+mmt = importlib.util.module_from_spec(spec)
+sys.modules['mmt'] = mmt
+spec.loader.exec_module(mmt)
+
+
+def peak_rss():
+    '''return the peak resident memory of the process in MB.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run(framework, instance, solver, method, limits, window=None):
+    '''run the phases of the model on a generated instance and return the record of each phase.
+    :param framework: 'DOCPLEX' or 'CVXPY'.
+    :param instance: keyword arguments of generate_instance.
+    :param solver: name of the CVXPY solver.
+    :param method: solve method of solve_model.
+    :param limits: time_limit and mip_gap keyword arguments of solve_model.
+    :param window: window length in days to solve over a rolling horizon with solve_rolling instead, which records
+    the size and time of every window.
+    '''
+    order, route = mmt.generate_instance(**instance)
+    model = mmt.MMT(framework)
+    records = []
+
+    def phase(name, function, result):
+        record = {'phase': name}
+        start = time.perf_counter()
+        try:
+            function()
+        except Exception as e:
+            record['error'] = repr(e)
+        record['time'] = time.perf_counter() - start
+        record['peak_rss_mb'] = peak_rss()
+        if 'error' not in record:
+            record.update(result())
+        records.append(record)
+        return 'error' not in record
+
+    if not phase('set_param', lambda: model.set_param(route, order),
+                 lambda: {'x': len(model.var_location[0]), 'y': len(model.var_2_location[0]),
+                          'pruned': model.pruned}):
+        return records
+    phase('heuristic', lambda: model.solve_model(method='heuristic'), lambda: {'objective': model.objective_value})
+    if window is not None:
+        phase('solve_rolling', lambda: model.solve_rolling(window, solver=getattr(mmt.cp, solver), method=method),
+              lambda: {'objective': model.objective_value, 'windows': model.stats['rolling']['windows']})
+        return records
+    if method == 'heuristic':
+        return records
+    # 'relaxation' and 'milp' solve the model matrices with scipy, without a framework model
+    if method == 'mip' and not phase('build_model', model.build_model, lambda: {
+            'variables': sum(model.stats['build_model'][v] for v in ['x', 'y', 'z']),
+            'constraints': model.stats['build_model']['constraints'],
+            'families': model.stats['build_model']['families']}):
+        return records
+    phase('solve_model', lambda: model.solve_model(getattr(mmt.cp, solver), method, **limits),
+          lambda: {'objective': model.objective_value, 'bound': model.stats['solve_model'].get('bound'),
+                   'mip_gap': model.stats['solve_model']['gap'], 'status': model.stats['solve_model']['status'],
+                   'progress': model.stats['progress']})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=4)
+    parser.add_argument('--ports', type=int, default=4, help='ports in each city, including the warehouse')
+    parser.add_argument('--lanes', type=int, default=None, help='lanes between cities besides the warehouse ring')
+    parser.add_argument('--frequency', type=int, default=3, help='weekdays with departures between cities')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--goods', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frameworks', nargs='+', default=['DOCPLEX', 'CVXPY'], choices=['DOCPLEX', 'CVXPY'])
+    parser.add_argument('--solver', default='CBC', help='CVXPY solver')
+    parser.add_argument('--method', default='mip', choices=['mip', 'heuristic', 'relaxation', 'milp'])
+    parser.add_argument('--time-limit', type=float, default=None, help='solver time limit in seconds')
+    parser.add_argument('--mip-gap', type=float, default=None, help='relative MIP gap tolerance')
+    parser.add_argument('--window', type=int, default=None, help='solve over a rolling horizon of windows of days')
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    instance = {name: getattr(args, name) for name in ['cities', 'ports', 'lanes', 'frequency', 'days', 'goods',
+                                                         'seed']}
+    limits = {'time_limit': args.time_limit, 'mip_gap': args.mip_gap}
+    results = {'instance': instance, 'solver': args.solver, 'method': args.method, 'limits': limits,
+               'window': args.window, 'python': platform.python_version(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': {}}
+    for framework in args.frameworks:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results['runs'][framework] = executor.submit(run, framework, instance, args.solver, args.method,
+                                                          limits, args.window).result()
+        for record in results['runs'][framework]:
+            print(framework, json.dumps(record, default=lambda value: value.item()))
+
+    with open(args.output, 'w') as file:
+        # numpy scalars are written as python numbers
+        json.dump(results, file, indent=2, default=lambda value: value.item())
+
+
+if __name__ == '__main__':
+    main()
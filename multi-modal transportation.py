@@ -4,18 +4,40 @@ Created on Thu Mar 15 09:32:04 2018
 
 @author: Ken Huang
 """
-from docplex.mp.model import Model
-from itertools import product
+from docplex.mp.advmodel import AdvModel
+from docplex.mp.progress import ProgressListener, ProgressClock
 import numpy as np
 import cvxpy as cp
 import pandas as pd
-import json
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.optimize import linprog, milp, LinearConstraint, Bounds
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import hashlib
+import os
+import time
 
 
 class MMT:
     '''a Model class that solves the multi-model transportation optimization problem.'''
 
-    def __init__(self, framework='DOCPLEX'):
+    # cost, time and warehouse fee of infeasible routes and ports
+    bigM = 100000
+    # parameters of each goods, see goods_param
+    goodsParam = ['kVol', 'kValue', 'kDDL', 'kStartPort', 'kEndPort', 'kStartTime', 'taxPct']
+    # options of the time limit in seconds and the relative MIP gap tolerance of the CVXPY solvers
+    solverOptions = {'CBC': ('maximumSeconds', 'allowableFractionGap'), 'HIGHS': ('time_limit', 'mip_rel_gap'),
+                     'GUROBI': ('TimeLimit', 'MIPGap')}
+    # the built model, callback and solution, which the worker processes of solve_scenarios do not need
+    builtState = ['var', 'var_2', 'var_3', 'model', 'objective', 'constraints', 'goods_rows', 'arc_rows', 'params',
+                  'xs', 'ys', 'zs', 'mip_start', 'callback']
+
+    def __init__(self, framework='DOCPLEX', callback=None):
+        '''
+        :param framework: 'DOCPLEX' or 'CVXPY'.
+        :param callback: function called as callback(event, record) with every record added to the stats, see report.
+        '''
         # parameters
         self.portSpace = None
         self.dateSpace = None
@@ -41,12 +63,16 @@ class MMT:
         self.available_routes = None
         # decision variables
         self.var = None
-        self.x = None
         self.var_2 = None
-        self.y = None
         self.var_3 = None
-        self.z = None
-        # result & solution
+        self.model = None
+        self.objective = None
+        self.constraints = None
+        self.goods_rows = None
+        self.arc_rows = None
+        # parameters of the CVXPY problem that a scenario changes, see update_objective
+        self.params = None
+        # result & solution, x, y and z values are flat over the variable index
         self.xs = None
         self.ys = None
         self.zs = None
@@ -56,55 +82,94 @@ class MMT:
         self.solution_ = None
         self.arrTime_ = None
         self.objective_value = None
+        self.lower_bound = None
         # helping variables
         self.var_location = None
         self.var_2_location = None
         self.var_3_location = None
+        self.var_arc = None
+        self.pruned = None
+        self.stayTimeOp = None
+        self.stayTimeConst = None
+        self.arrTimeOp = None
+        self.whCostCoef = None
+        self.whCostConst = None
+        self.pinned = None
+        self.mip_start = None
+        self.scenario = None
+        # last day planned by the sub-problem of a rolling window and the cost of the rest of the way of each goods
+        # from each port, infinite at the ports where it cannot end the window, see solve_rolling
+        self.windowEnd = None
+        self.terminalCost = None
+        # timing, size and solver statistics, see report
+        self.stats = {}
+        self.callback = callback
 
         if framework not in ['CVXPY', 'DOCPLEX']:
             raise ValueError('Framework not supported, the model only supports CVXPY and DOCPLEX')
         else:
             self.framework = framework
 
-    def set_param(self, route, order):
-        '''set model parameters based on the read-in route and order information.'''
+    def __getstate__(self):
+        # parameter tensors mapped from the cache are pickled by their file, see map_state
+        return map_state(self.__dict__)
 
-        bigM = 100000
-        route = route[route['Feasibility'] == 1]
-        route['Warehouse Cost'][route['Warehouse Cost'].isnull()] = bigM
-        route = route.reset_index()
+    def __setstate__(self, state):
+        self.__dict__.update(unmap_state(state))
 
-        portSet = set(route['Source']) | set(route['Destination'])
+    def set_param(self, route, order, prune=True, sparse=False, cache_dir=None):
+        '''set model parameters based on the read-in route and order information.
+        :param prune: whether to leave out the decision variables that cannot lie on any deadline-feasible path,
+        see reach_bounds.
+        :param sparse: whether to store the route cost and time tensors by lane, see LaneTensor.
+        :param cache_dir: directory where the route cost and time tensors are cached as .npy files under the hash
+        of the routes and horizon. Cached tensors are memory-mapped read-only, so that processes share them.
+        '''
 
-        self.portSpace = len(portSet)
-        self.portIndex = dict(zip(range(len(portSet)), portSet))
+        start = time.perf_counter()
+        bigM = self.bigM
+        route = route[route['Feasibility'] == 1]
+
+        # ports are coded by their sorted names
+        ports = pd.Categorical(pd.concat([route['Source'], route['Destination']], ignore_index=True).astype(str))
+        source, destination = np.split(ports.codes.astype(int), 2)
+        self.portSpace = len(ports.categories)
+        self.portIndex = dict(enumerate(ports.categories))
         self.indexPort = dict(zip(self.portIndex.values(), self.portIndex.keys()))
 
         self.maxDate = np.max(order['Required Delivery Date'])
         self.minDate = np.min(order['Order Date'])
         self.dateSpace = (self.maxDate - self.minDate).days
-        startWeekday = self.minDate.weekday() + 1
-        weekday = np.mod((np.arange(self.dateSpace) + startWeekday), 7)
-        weekday[weekday == 0] = 7
-        weekdayDateList = {i: [] for i in range(1, 8)}
-        for i in range(len(weekday)):
-            weekdayDateList[weekday[i]].append(i)
-        for i in weekdayDateList:
-            weekdayDateList[i] = json.dumps(weekdayDateList[i])
-
-        source = list(route['Source'].replace(self.indexPort))
-        destination = list(route['Destination'].replace(self.indexPort))
-        DateList = list(route['Weekday'].replace(weekdayDateList).apply(json.loads))
+        # a route departs on the first day of its weekday in the horizon and every 7 days after
+        first = (np.array(route['Weekday'], dtype=int) - 1 - self.minDate.weekday()) % 7
+        date = first[:, None] + 7 * np.arange(-(-self.dateSpace // 7))
+        row, week = np.nonzero(date < self.dateSpace)
+        date = date[row, week]
 
+        lanes, laneRow = np.unique(source * self.portSpace + destination, return_inverse=True)
+        lanes = np.unravel_index(lanes, (self.portSpace, self.portSpace))
         self.goods = order.shape[0]
-        self.tranCost = np.ones([self.portSpace, self.portSpace, self.dateSpace]) * bigM
-        self.tranFixedCost = np.ones([self.portSpace, self.portSpace, self.dateSpace]) * bigM
-        self.tranTime = np.ones([self.portSpace, self.portSpace, self.dateSpace]) * bigM
-
-        for i in range(route.shape[0]):
-            self.tranCost[source[i], destination[i], DateList[i]] = route['Cost'][i]
-            self.tranFixedCost[source[i], destination[i], DateList[i]] = route['Fixed Freight Cost'][i]
-            self.tranTime[source[i], destination[i], DateList[i]] = route['Time'][i]
+        names = ['tranCost', 'tranFixedCost', 'tranTime']
+        cache = None if cache_dir is None else os.path.join(cache_dir, 'param-' + content_hash(
+            route, self.portSpace, self.minDate, self.dateSpace, bigM, sparse))
+        tensors = None if cache is None else load_arrays(cache, ['lane'] + names)
+        if tensors is None:
+            # lane index of each port pair, the port pairs without lane point to a last row of bigM
+            tensors = {'lane': np.full((self.portSpace, self.portSpace), len(lanes[0]), dtype=np.int32)}
+            tensors['lane'][lanes] = np.arange(len(lanes[0]))
+            for name, column in zip(names, ['Cost', 'Fixed Freight Cost', 'Time']):
+                # float32 costs as long as they are exact, days as int32 as bigM does not fit in int16
+                value = np.array(route[column], dtype=float)
+                dtype = np.int32 if name == 'tranTime' else \
+                    np.float32 if np.array_equal(value.astype(np.float32), value) else np.float64
+                tensors[name] = np.full((len(lanes[0]) + 1, self.dateSpace), bigM, dtype=dtype)
+                tensors[name][laneRow[row], date] = value[row]
+                if not sparse:
+                    tensors[name] = tensors[name][tensors['lane']]
+            if cache is not None:
+                tensors = save_arrays(cache, tensors)
+        for name in names:
+            setattr(self, name, LaneTensor(tensors['lane'], tensors[name]) if sparse else tensors[name])
 
         self.transitDuty = np.ones([self.portSpace, self.portSpace]) * bigM
         self.transitDuty[source, destination] = route['Transit Duty']
@@ -113,202 +178,1399 @@ class MMT:
         self.ctnVol = np.ones([self.portSpace, self.portSpace]) * 0.1
         self.ctnVol[source, destination] = route['Container Size']
         self.ctnVol = self.ctnVol.reshape(self.portSpace, self.portSpace, 1)
-        self.whCost = route[['Source', 'Warehouse Cost']].drop_duplicates()
-        self.whCost['index'] = self.whCost['Source'].replace(self.indexPort)
-        self.whCost = np.array(self.whCost.sort_values(by='index')['Warehouse Cost'])
-        self.kVol = np.array(order['Volume'])
-        self.kValue = np.array(order['Order Value'])
-        self.kDDL = np.array((order['Required Delivery Date'] - self.minDate).dt.days)
-        self.kStartPort = np.array(order['Ship From'].replace(self.indexPort))
-        self.kEndPort = np.array(order['Ship To'].replace(self.indexPort))
-        self.kStartTime = np.array((order['Order Date'] - self.minDate).dt.days)
-        self.taxPct = np.array(order['Tax Percentage'])
+        # warehouse cost of each port, bigM for ports without warehouse
+        self.whCost = np.full(self.portSpace, float(bigM))
+        np.minimum.at(self.whCost, source, np.array(route['Warehouse Cost'].fillna(bigM), dtype=float))
+        for name, value in self.goods_param(order).items():
+            setattr(self, name, value)
 
         # add available route indexes
-        self.route_num = route[['Source', 'Destination']].drop_duplicates().shape[0]
-        routes = route[['Source', 'Destination']].drop_duplicates().replace(self.indexPort)
-        self.available_routes = list(zip(routes['Source'], routes['Destination']))
+        self.route_num = len(lanes[0])
+        self.available_routes = list(zip(*(i.tolist() for i in lanes)))
         # localization variables of decision variables in the matrix
-        var_location = product(self.available_routes, range(self.dateSpace), range(self.goods))
-        var_location = [(i[0][0], i[0][1], i[1], i[2]) for i in var_location]
-        self.var_location = tuple(zip(*var_location))
+        self.set_var_location(prune)
+        self.report('set_param', {'time': time.perf_counter() - start, 'x': len(self.var_location[0]),
+                                  'y': len(self.var_2_location[0]), 'pruned': self.pruned})
+
+    def report(self, event, record):
+        '''add a record to the stats and pass it to the callback. The records of 'progress' events are appended to
+        the solver progress of the last solve, the others replace the record of the same event.
+        :param event: 'set_param', 'build_model', 'heuristic', 'solve_model', 'set_solution', 'rolling' or
+        'progress'.
+        :param record: dict of the statistics.
+        :return: None
+        '''
+        if event == 'progress':
+            self.stats.setdefault('progress', []).append(record)
+        else:
+            self.stats[event] = record
+        if self.callback is not None:
+            self.callback(event, record)
+
+    def goods_param(self, order):
+        '''return the parameters of the goods in the read-in order information.'''
+
+        ports = [pd.Categorical(order[column].astype(str), categories=list(self.indexPort)).codes.astype(int)
+                 for column in ['Ship From', 'Ship To']]
+        if np.any(np.concatenate(ports) < 0):
+            raise ValueError('Orders shipped from or to ports without feasible routes')
 
-        var_2_location = product(self.available_routes, range(self.dateSpace))
-        var_2_location = [(i[0][0], i[0][1], i[1]) for i in var_2_location]
-        self.var_2_location = tuple(zip(*var_2_location))
+        return {'kVol': np.array(order['Volume']),
+                'kValue': np.array(order['Order Value']),
+                'kDDL': np.array((order['Required Delivery Date'] - self.minDate).dt.days),
+                'kStartPort': ports[0],
+                'kEndPort': ports[1],
+                'kStartTime': np.array((order['Order Date'] - self.minDate).dt.days),
+                'taxPct': np.array(order['Tax Percentage'])}
 
+    def set_var_location(self, prune=False):
+        '''localize the decision variables in the matrix, see goods_var_location.
+        :param prune: whether to leave out the decision variables off the deadline-feasible paths of their goods.
+        '''
+
+        self.var_location, pruned = self.goods_var_location(range(self.goods), prune)
+        self.pruned = pruned if prune else None
+        self.set_var_2_location()
+
+    def goods_var_location(self, goods, prune=False):
+        '''return the location of the decision variables of the given goods. A route only gets variables on the
+        dates it departs in the weekly schedule, and a goods only on the departures that lie inside its
+        [order date, deadline] window. Variables of goods are stored contiguously, goods by goods.
+        :param prune: whether a goods only gets variables on the departures that can lie on one of its
+        deadline-feasible paths, see reach_bounds. Goods are expanded block by block, so that the departures cut
+        off are never expanded.
+        :return: the location of the variables and the number of variables pruned.
+        '''
+
+        source, destination, date, arrDate = self.departures()
+        goods = np.array(goods, dtype=int)
+        # goods expanded at a time, with a row of all departures for each
+        block = max(1, 2 ** 22 // max(len(date), 1))
+        location, pruned = [], 0
+        for n in range(0, len(goods), block):
+            g = goods[n:n + block]
+            keep = (date >= self.kStartTime[g, None]) & (arrDate <= self.kDDL[g, None])
+            if prune:
+                earliest, latest = self.reach_bounds(g, source, destination, date, arrDate)
+                rows = np.arange(len(g))[:, None]
+                window = np.count_nonzero(keep)
+                keep &= (date >= earliest[rows, source]) & (arrDate <= latest[rows, destination]) & \
+                        (destination != self.kStartPort[g, None]) & (source != self.kEndPort[g, None])
+                pruned += window - np.count_nonzero(keep)
+            row, arcs = np.nonzero(keep)
+            location.append((source[arcs], destination[arcs], date[arcs], g[row]))
+        empty = np.zeros(0, dtype=int)
+        location = tuple(np.concatenate([part[n] for part in location] + [empty]).astype(int, copy=False)
+                         for n in range(4))
+
+        return location, int(pruned)
+
+    def departures(self):
+        '''return the start port, end port, date and arrival date of every departure in the weekly schedule.'''
+
+        source, destination = (np.array(i, dtype=int) for i in zip(*self.available_routes))
+        routeIndex, date = np.nonzero(self.tranTime[source, destination, :] < self.bigM)
+        source, destination = source[routeIndex], destination[routeIndex]
+
+        return source, destination, date, date + self.tranTime[source, destination, date]
+
+    def reach_bounds(self, goods, source, destination, date, arrDate, keep=None):
+        '''return the earliest arrival at and the latest departure from each port of the given goods, as goods x ports
+        arrays, searched on the departure graph without expanding the goods onto it. The earliest arrivals are
+        searched forward from the origin at order date, the latest departures backward from the destination at
+        deadline, never out of the destination nor into the origin. Each round asks every lane, for all goods at
+        once, the earliest arrival of its departures on or after a day (minimum over the later departures) and the
+        latest departure of those arriving on or before a day (maximum over the earlier arrivals). A port that
+        cannot be reached has an earliest arrival after the horizon and a latest departure before it.
+        :param goods: indexes of the goods.
+        :param source, destination, date, arrDate: the departures, see departures.
+        :param keep: goods x departures mask of the departures each goods can take, default to all of them.
+        '''
+
+        n, ports = len(goods), self.portSpace
+        earliest = np.full((n, ports), np.inf)
+        earliest[range(n), self.kStartPort[goods]] = self.kStartTime[goods]
+        latest = np.full((n, ports), -np.inf)
+        latest[range(n), self.kEndPort[goods]] = self.kDDL[goods]
+        if len(date) == 0:
+            return earliest, latest
+
+        # departures of a lane are keyed by lane * span + day, so that one sorted array holds all lanes
+        span = int(max(np.max(arrDate), self.dateSpace)) + 2
+        lanes, lane = np.unique(source * ports + destination, return_inverse=True)
+        laneSource, laneDestination = lanes // ports, lanes % ports
+        offset = np.arange(len(lanes)) * span
+        laneEnd = np.cumsum(np.bincount(lane, minlength=len(lanes)))
+        laneStart = laneEnd - np.bincount(lane, minlength=len(lanes))
+        # earliest arrival of the departures of a lane on or after each one, by date, for each goods. A departure
+        # the goods cannot take arrives after the horizon, which stays within the keys of its lane
+        byDate = np.lexsort((date, lane))
+        dateKey = offset[lane[byDate]] + date[byDate]
+        arrival = arrDate[byDate][None] if keep is None else np.where(keep[:, byDate], arrDate[byDate], span)
+        firstArr = np.minimum.accumulate((offset[lane[byDate]] + arrival)[:, ::-1], axis=1)[:, ::-1] - \
+            offset[lane[byDate]]
+        # latest departure of the departures of a lane arriving on or before each one, by arrival date, for each
+        # goods. A departure the goods cannot take leaves before the horizon
+        byArr = np.lexsort((arrDate, lane))
+        arrKey = offset[lane[byArr]] + arrDate[byArr]
+        departure = date[byArr][None] if keep is None else np.where(keep[:, byArr], date[byArr], -1)
+        lastDate = np.maximum.accumulate(offset[lane[byArr]] + departure, axis=1) - offset[lane[byArr]]
+        # lanes grouped by end port and by start port
+        toPort = np.argsort(laneDestination, kind='stable')
+        toPorts, toStart = np.unique(laneDestination[toPort], return_index=True)
+        fromPort = np.argsort(laneSource, kind='stable')
+        fromPorts, fromStart = np.unique(laneSource[fromPort], return_index=True)
+        noOut = laneSource == self.kEndPort[goods, None]
+        noIn = laneDestination == self.kStartPort[goods, None]
+
+        while True:
+            day = np.minimum(earliest[:, laneSource], span - 1)
+            pos = np.searchsorted(dateKey, offset + day)
+            arrival = np.where((pos < laneEnd) & ~noOut,
+                               np.take_along_axis(firstArr, np.minimum(pos, len(date) - 1), axis=1), np.inf)
+            reach = earliest.copy()
+            reach[:, toPorts] = np.minimum(reach[:, toPorts], np.minimum.reduceat(arrival[:, toPort], toStart, axis=1))
+            if np.array_equal(reach, earliest):
+                break
+            earliest = reach
+        while True:
+            day = np.maximum(latest[:, laneDestination], -1)
+            pos = np.searchsorted(arrKey, offset + day, side='right') - 1
+            departure = np.where((pos >= laneStart) & ~noIn, np.take_along_axis(lastDate, np.maximum(pos, 0), axis=1),
+                                 -np.inf)
+            reach = latest.copy()
+            reach[:, fromPorts] = np.maximum(reach[:, fromPorts],
+                                             np.maximum.reduceat(departure[:, fromPort], fromStart, axis=1))
+            if np.array_equal(reach, latest):
+                break
+            latest = reach
+
+        return earliest, latest
+
+    def set_var_2_location(self):
+        '''localize the container number and route usage variables, one for each departure that some goods can
+        take, and link every decision variable to its departure.'''
+
+        i, j, t, _ = self.var_location
+        arcs = np.ravel_multi_index((i, j, t), (self.portSpace, self.portSpace, self.dateSpace))
+        arcs, self.var_arc = np.unique(arcs, return_inverse=True)
+        self.var_2_location = np.unravel_index(arcs, (self.portSpace, self.portSpace, self.dateSpace))
         self.var_3_location = self.var_2_location
+        self.set_warehouse_operator()
+
+    def keep_vars(self, keep):
+        '''keep the decision variables selected by a boolean mask over the variable index and drop the others, the
+        pinned legs (see pin_legs) with them.'''
+
+        self.var_location = tuple(v[keep] for v in self.var_location)
+        if self.pinned is not None:
+            self.pinned = self.pinned[keep]
+        self.set_var_2_location()
+
+    def prune_routes(self):
+        '''remove every decision variable that cannot lie on any deadline-feasible path of its goods, as set_param
+        does with prune, over the departures each goods has in the variable index (see reach_bounds). A goods can
+        only take a departure after its earliest arrival at the start port that still reaches the end port before
+        its latest departure from there, and never into its origin or out of its destination.
+        :return: number of decision variables pruned.
+        '''
+
+        i, j, t, k = self.var_location
+        arrTime = t + self.tranTime[i, j, t]
+        source, destination, date = self.var_2_location
+        arrDate = date + self.tranTime[source, destination, date]
+        bounds = np.searchsorted(k, np.arange(self.goods + 1))
+        keep = np.zeros(len(k), dtype=bool)
+        # goods searched at a time, with a row of all departures for each
+        block = max(1, 2 ** 22 // max(len(date), 1))
+        for n in range(0, self.goods, block):
+            goods = np.arange(n, min(n + block, self.goods))
+            var = np.arange(bounds[goods[0]], bounds[goods[-1] + 1])
+            taken = np.zeros((len(goods), len(date)), dtype=bool)
+            taken[k[var] - n, self.var_arc[var]] = True
+            earliest, latest = self.reach_bounds(goods, source, destination, date, arrDate, taken)
+            keep[var] = (t[var] >= earliest[k[var] - n, i[var]]) & (arrTime[var] <= latest[k[var] - n, j[var]]) & \
+                        (j[var] != self.kStartPort[k[var]]) & (i[var] != self.kEndPort[k[var]])
+        self.keep_vars(keep)
+
+        return int(len(keep) - np.count_nonzero(keep))
 
     def build_model(self):
         '''overall function to build up model objective and constraints'''
+        start = time.perf_counter()
         if self.framework == 'CVXPY':
-            self.cvxpy_build_model()
+            families = self.cvxpy_build_model()
         elif self.framework == 'DOCPLEX':
-            self.cplex_build_model()
+            families = self.cplex_build_model()
+        if self.scenario is not None:
+            self.update_objective()
+        self.report('build_model', {'time': time.perf_counter() - start, 'x': len(self.var_location[0]),
+                                    'y': len(self.var_2_location[0]), 'z': len(self.var_3_location[0]),
+                                    'constraints': sum(family['rows'] for family in families.values()),
+                                    'families': families})
 
     def cvxpy_build_model(self):
-        '''build up the mathematical programming model's objective and constraints using CVXPY framework.'''
-
-        # 4 dimensional binary decision variable matrix
-        self.var = cp.Variable(self.route_num * self.dateSpace * self.goods, boolean=True, name='x')
-        self.x = np.zeros((self.portSpace, self.portSpace, self.dateSpace, self.goods)).astype('object')
-        self.x[self.var_location] = list(self.var)
-        # 3 dimensional container number matrix
-        self.var_2 = cp.Variable(self.route_num * self.dateSpace, integer=True, name='y')
-        self.y = np.zeros((self.portSpace, self.portSpace, self.dateSpace)).astype('object')
-        self.y[self.var_2_location] = list(self.var_2)
-        # 3 dimensional route usage matrix
-        self.var_3 = cp.Variable(self.route_num * self.dateSpace, boolean=True, name='z')
-        self.z = np.zeros((self.portSpace, self.portSpace, self.dateSpace)).astype('object')
-        self.z[self.var_3_location] = list(self.var_3)
-        # warehouse related cost
-        warehouseCost, arrTime, stayTime = self.warehouse_fee(self.x)
+        '''build up the mathematical programming model's objective and constraints using CVXPY framework.
+        :return: the number of rows, assembly time of the coefficient matrix (see constraint_matrix) and time to add
+        the rows to the model of each constraint family.
+        '''
+
+        # binary decision variables, one for each (start port, end port, time, goods) in the variable index
+        self.var = cp.Variable(len(self.var_location[0]), boolean=True, name='x')
+        # container number variables, one for each (start port, end port, time) in the variable index
+        self.var_2 = cp.Variable(len(self.var_2_location[0]), integer=True, name='y')
+        # route usage variables, one for each (start port, end port, time) in the variable index
+        self.var_3 = cp.Variable(len(self.var_3_location[0]), boolean=True, name='z')
+        dvars = cp.hstack([self.var, self.var_2, self.var_3])
         ###objective###
-        transportCost = np.sum(self.y * self.tranCost) + np.sum(self.z * self.tranFixedCost)
-        transitDutyCost = np.sum(np.sum(np.dot(self.x, self.kValue), axis=2) * self.transitDuty)
-        taxCost = np.sum(self.taxPct * self.kValue) + transitDutyCost
-        objective = cp.Minimize(transportCost + warehouseCost + taxCost)
+        # objective coefficients and the upper bounds of the variables, 0 on departures closed by a scenario, are
+        # parameters, so that the problem compiled by the first solve is reused by the solves of other scenarios (see
+        # update_objective). Bounds are on the right hand side, as parameters in the coefficients do not scale.
+        coef, constant = self.objective_vector()
+        self.params = {'coef': cp.Parameter(len(coef), value=coef), 'constant': cp.Parameter(value=constant),
+                       'upper': cp.Parameter(len(coef), value=self.upper_bounds())}
+        objective = cp.Minimize(self.params['coef'] @ dvars + self.params['constant'])
         ###constraint###
         constraints = []
-        # 1.Goods must be shipped out from its origin to another node and shipped to its destination.
-        constraints += [np.sum(self.x[self.kStartPort[k], :, :, k]) == 1 for k in range(self.goods)]
-        constraints += [np.sum(self.x[:, self.kEndPort[k], :, k]) == 1 for k in range(self.goods)]
-        # 2.For each goods k, it couldn't be shipped out from its destination or shipped to its origin.
-        constraints += [np.sum(self.x[:, self.kStartPort[k], :, k]) == 0 for k in range(self.goods)]
-        constraints += [np.sum(self.x[self.kEndPort[k], :, :, k]) == 0 for k in range(self.goods)]
-        # 3.constraint for transition point
-        for k in range(self.goods):
-            for j in range(self.portSpace):
-                if (j != self.kStartPort[k]) & (j != self.kEndPort[k]):
-                    constraints.append(np.sum(self.x[:, j, :, k]) == np.sum(self.x[j, :, :, k]))
-        # 4.each goods can only be transitioned in or out of a port for at most once
-        constraints += [np.sum(self.x[i, :, :, k]) <= 1 for k in range(self.goods) for i in range(self.portSpace)]
-        constraints += [np.sum(self.x[:, j, :, k]) <= 1 for k in range(self.goods) for j in range(self.portSpace)]
-        # 5.transition-out should be after transition-in
-        constraints += [stayTime[j, k] >= 0 for j in range(self.portSpace) for k in range(self.goods)]
-        # 6.constraint for number of containers used
-        numCtn = np.dot(self.x, self.kVol) / self.ctnVol
-        constraints += [self.y[i, j, t] - numCtn[i, j, t] >= 0 \
-                        for i in range(self.portSpace) for j in range(self.portSpace) for t in
-                        range(self.dateSpace) if not isinstance(self.y[i, j, t] - numCtn[i, j, t] >= 0, bool)]
-        # 7. constraint to check whether a route is used
-        constraints += [self.z[i, j, t] >= (np.sum(self.x[i, j, t, :]) * 10e-5) \
-                        for i in range(self.portSpace) for j in range(self.portSpace) for t in
-                        range(self.dateSpace) if
-                        not isinstance(self.z[i, j, t] >= (np.sum(self.x[i, j, t, :]) * 10e-5), bool)]
-        # 8.time limitation constraint for each goods
-        constraints += [np.sum(arrTime[:, self.kEndPort[k], :, k]) <= self.kDDL[k] for k in range(self.goods)
-                        if not isinstance(np.sum(arrTime[:, self.kEndPort[k], :, k]) <= self.kDDL[k], bool)]
+        families = {}
+        times = {}
+        matrices = self.constraint_matrix(times)
+        start = time.perf_counter()
+        for name, A, sense, rhs, _ in matrices:
+            if sense == 'eq':
+                constraints.append(A @ dvars == rhs)
+            elif sense == 'le':
+                constraints.append(A @ dvars <= rhs)
+            else:
+                constraints.append(A @ dvars >= rhs)
+            families[name] = {'rows': A.shape[0], 'assembly': times[name], 'time': time.perf_counter() - start}
+            start = time.perf_counter()
+        # legs already dispatched
+        if self.pinned is not None and self.pinned.any():
+            constraints.append(self.var[np.nonzero(self.pinned)[0]] == 1)
+            families['pinned'] = {'rows': constraints[-1].size, 'time': time.perf_counter() - start}
+        # variables of closed departures
+        constraints.append(dvars <= self.params['upper'])
         model = cp.Problem(objective, constraints)
 
         self.objective = objective
         self.constraints = constraints
         self.model = model
+        return families
 
     def cplex_build_model(self):
-        '''build up the mathematical programming model's objective and constraints using DOCPLEX framework.'''
-        model = Model()
-        # 4 dimensional binary decision variable matrix
-        self.var = model.binary_var_list(self.route_num * self.dateSpace * self.goods, name='x')
-        self.x = np.zeros((self.portSpace, self.portSpace, self.dateSpace, self.goods)).astype('object')
-        self.x[self.var_location] = self.var
-        # 3 dimensional container number matrix
-        self.var_2 = model.integer_var_list(self.route_num * self.dateSpace, name='y')
-        self.y = np.zeros((self.portSpace, self.portSpace, self.dateSpace)).astype('object')
-        self.y[self.var_2_location] = self.var_2
-        # 3 dimensional route usage matrix
-        self.var_3 = model.binary_var_list(self.route_num * self.dateSpace, name='z')
-        self.z = np.zeros((self.portSpace, self.portSpace, self.dateSpace)).astype('object')
-        self.z[self.var_3_location] = self.var_3
-        # warehouse related cost
-        warehouseCost, arrTime, stayTime = self.warehouse_fee(self.x)
+        '''build up the mathematical programming model's objective and constraints using DOCPLEX framework.
+        :return: the number of rows, assembly time of the coefficient matrix (see constraint_matrix) and time to add
+        the rows to the model of each constraint family.
+        '''
+        model = AdvModel()
+        # binary decision variables, one for each (start port, end port, time, goods) in the variable index
+        self.var = model.binary_var_list(len(self.var_location[0]), name='x')
+        # container number variables, one for each (start port, end port, time) in the variable index
+        self.var_2 = model.integer_var_list(len(self.var_2_location[0]), name='y')
+        # route usage variables, one for each (start port, end port, time) in the variable index
+        self.var_3 = model.binary_var_list(len(self.var_3_location[0]), name='z')
+        dvars = self.var + self.var_2 + self.var_3
+        # legs already dispatched
+        if self.pinned is not None and self.pinned.any():
+            model.change_var_lower_bounds([self.var[n] for n in np.nonzero(self.pinned)[0]], 1)
         ###objective###
-        transportCost = np.sum(self.y * self.tranCost) + np.sum(self.z * self.tranFixedCost)
-        transitDutyCost = np.sum(np.sum(np.dot(self.x, self.kValue), axis=2) * self.transitDuty)
-        taxCost = np.sum(self.taxPct * self.kValue) + transitDutyCost
-        model.minimize(transportCost + warehouseCost + taxCost)
+        coef, constant = self.objective_vector()
+        model.minimize(model.scal_prod_vars_all_different(dvars, coef) + constant)
         ###constraint###
+        # constraints of each goods and of each departure, kept to modify the model in place
+        self.goods_rows = [[] for _ in range(self.goods)]
+        self.arc_rows = [[] for _ in range(len(self.var_2_location[0]))]
+        families = {}
+        times = {}
+        matrices = self.constraint_matrix(times)
+        start = time.perf_counter()
+        for name, A, sense, rhs, goods in matrices:
+            cts = model.add_constraints(model.matrix_constraints(A, dvars, rhs, sense))
+            for n, (g, ct) in enumerate(zip(goods, cts)):
+                (self.goods_rows[g] if g >= 0 else self.arc_rows[n]).append(ct)
+            families[name] = {'rows': A.shape[0], 'assembly': times[name], 'time': time.perf_counter() - start}
+            start = time.perf_counter()
+
+        self.objective = model.objective_expr
+        self.constraints = list(model.iter_constraints())
+        self.model = model
+        return families
+
+    def objective_vector(self):
+        '''return the objective coefficients over the variable vector [x, y, z] and the constant part of the
+        objective.'''
+
+        costs = self.cost_vectors().values()
+
+        return sum(coef for coef, _ in costs), sum(constant for _, constant in costs)
+
+    def cost_vectors(self):
+        '''return the transportation, warehouse and tax cost as linear functions over the variable vector [x, y, z],
+        each as coefficients and constant, under the scenario of the model (see set_scenario). The sub-problem of a
+        rolling window also has the terminal cost of the port where each goods ends the window.'''
+
+        i, j, t, k = self.var_location
+        route = self.var_2_location
+        nx, ny = len(k), len(route[0])
+        factor = self.scenario or self.scenario_param({})
+        transitDutyCost = self.kValue[k] * self.transitDuty[i, j] * factor['transitDuty'][i, j]
+        # warehouse fee with the warehouse cost of the scenario, see set_warehouse_operator
+        whCost = np.outer(self.whCost * factor['whCost'], self.kVol).ravel()
+
+        costs = {'transport': (np.concatenate([np.zeros(nx), self.tranCost[route] * factor['tranCost'][route[:2]],
+                                               self.tranFixedCost[route] * factor['tranFixedCost'][route[:2]]]), 0),
+                 'warehouse': (np.concatenate([self.stayTimeOp.T @ whCost, np.zeros(2 * ny)]),
+                               whCost @ self.stayTimeConst),
+                 'tax': (np.concatenate([transitDutyCost, np.zeros(2 * ny)]), np.sum(self.taxPct * self.kValue))}
+        if self.windowEnd is not None:
+            # the terminal cost of the port a goods ends at, telescoped over its legs from the origin, 0 at destination.
+            # Goods pass through the ports where they cannot end, whatever cost is left there cancels out
+            terminal = np.where(np.isfinite(self.terminalCost), self.terminalCost, 0)
+            costs['terminal'] = (np.concatenate([terminal[k, j] - terminal[k, i], np.zeros(2 * ny)]),
+                                 np.sum(terminal[range(self.goods), self.kStartPort]))
+
+        return costs
+
+    def closed_vars(self):
+        '''return whether each variable of the vector [x, y, z] lies on a departure closed by the scenario of the
+        model (see set_scenario), and is fixed to 0.'''
+
+        route = self.var_2_location
+        if self.scenario is None:
+            return np.zeros(len(self.var_location[0]) + 2 * len(route[0]), dtype=bool)
+        closed = self.scenario['closed'][route[0], route[1], (self.minDate.weekday() + route[2]) % 7]
+
+        return np.concatenate([closed[self.var_arc], closed, closed])
+
+    def upper_bounds(self):
+        '''return the upper bound of each variable of the vector [x, y, z], 0 on departures closed by the scenario of
+        the model and bigM containers otherwise.'''
+
+        nx, ny = len(self.var_location[0]), len(self.var_2_location[0])
+        upper = np.concatenate([np.ones(nx), np.full(ny, float(self.bigM)), np.ones(ny)])
+        upper[self.closed_vars()] = 0
+
+        return upper
+
+    def scenario_param(self, scenario):
+        '''return the factors of the route parameters and the closed departures of a scenario, see set_scenario.'''
+
+        unknown = set(scenario) - {'tranCost', 'tranFixedCost', 'transitDuty', 'whCost', 'closed'}
+        if unknown:
+            raise ValueError('Scenario parameters not supported: ' + ', '.join(sorted(unknown)))
+        ports = self.portSpace
+
+        def port(name):
+            if name not in self.indexPort:
+                raise ValueError('Scenario port without feasible routes: ' + str(name))
+            return self.indexPort[name]
+
+        param = {}
+        for name, shape in [('tranCost', (ports, ports)), ('tranFixedCost', (ports, ports)),
+                            ('transitDuty', (ports, ports)), ('whCost', (ports,))]:
+            value = scenario.get(name, 1)
+            param[name] = np.full(shape, 1.0 if isinstance(value, dict) else float(value))
+            if isinstance(value, dict):
+                for key, factor in value.items():
+                    param[name][(port(key),) if name == 'whCost' else (port(key[0]), port(key[1]))] = factor
+        # closed weekdays of each route, numbered from 0 for Monday
+        param['closed'] = np.zeros((ports, ports, 7), dtype=bool)
+        for closed in scenario.get('closed', []):
+            weekdays = np.arange(7) if len(closed) < 3 else np.array(closed[2], dtype=int) - 1
+            param['closed'][port(closed[0]), port(closed[1]), weekdays] = True
+
+        return param
+
+    def set_scenario(self, scenario):
+        '''set a what-if scenario of the route parameters. The built model is changed in place, as only objective
+        coefficients and variable bounds change, and the next solves, the heuristic and the cost breakdown of the
+        solution follow the scenario.
+        :param scenario: dict of the changes to the route parameters, None to go back to the parameters of set_param:
+        'tranCost', 'tranFixedCost' and 'transitDuty': factor of the cost per container, fixed cost or transit duty
+        of every route, or dict of the factor by (source, destination) of given routes;
+        'whCost': factor of the warehouse cost of every port, or dict of the factor by port;
+        'closed': list of the routes closed, as (source, destination) on every day or (source, destination, weekdays)
+        with the weekdays numbered from 1 for Monday, as in the route information.
+        Ports are named as in the route information.
+        :return: None
+        '''
+
+        self.scenario = None if scenario is None else self.scenario_param(scenario)
+        if self.model is not None:
+            self.update_objective()
+
+    def update_objective(self):
+        '''change the objective coefficients of the built model, and fix the variables of closed departures to 0,
+        as in the scenario of the model. A CVXPY problem only gets new parameter values, so the next solve reuses
+        its compiled form.'''
+
+        coef, constant = self.objective_vector()
+        closed = np.nonzero(self.closed_vars())[0]
+        if self.framework == 'CVXPY':
+            self.params['coef'].value, self.params['constant'].value = coef, constant
+            self.params['upper'].value = self.upper_bounds()
+        elif self.framework == 'DOCPLEX':
+            dvars = self.var + self.var_2 + self.var_3
+            self.model.minimize(self.model.scal_prod_vars_all_different(dvars, coef) + constant)
+            # bounds of the variables closed by a previous scenario are reset first
+            self.model.change_var_upper_bounds(dvars, None)
+            self.model.change_var_upper_bounds([dvars[n] for n in closed], 0)
+            self.objective = self.model.objective_expr
+
+    def constraint_matrix(self, times=None):
+        '''return the model constraints as a list of (name, coefficient matrix, sense, right hand side, goods) over
+        the variable vector [x, y, z]. Coefficient matrices are assembled in sparse form directly from the variable
+        index, one row per goods, per (port, goods) or per (start port, end port, time). goods is the goods each row
+        constrains, -1 for the rows of a departure.
+        :param times: dict that receives the assembly time in seconds of each constraint family by name.
+        '''
+
+        i, j, t, k = self.var_location
+        nx, ny = len(k), len(self.var_2_location[0])
+        shape = nx + 2 * ny
+        col = np.arange(nx)
+        ones = np.ones(nx)
+        start, end = self.kStartPort[k], self.kEndPort[k]
+        # rows of (port, goods) pairs
+        outRow, inRow = k * self.portSpace + i, k * self.portSpace + j
+        pairs = self.goods * self.portSpace
+        goods, pairGoods, arcGoods = np.arange(self.goods), np.arange(pairs) // self.portSpace, np.full(ny, -1)
+        times = {} if times is None else times
+
+        def matrix(rows, cols, data, nrows):
+            return sp.csr_matrix((data, (rows, cols)), shape=(nrows, shape))
+
+        constraints = []
+        clock = [time.perf_counter()]
+
+        def add(name, A, sense, rhs, goods):
+            # drop the rows without any variable that are trivially satisfied
+            trivial = {'eq': rhs == 0, 'le': rhs >= 0, 'ge': rhs <= 0}[sense] & (A.getnnz(axis=1) == 0)
+            constraints.append((name, A[~trivial], sense, rhs[~trivial], goods[~trivial]))
+            # the family is assembled since the previous family was added
+            times[name] = time.perf_counter() - clock[0]
+            clock[0] = time.perf_counter()
+
+        # in a rolling window, goods may stay at their origin or end at any port (see solve_rolling)
+        window = self.windowEnd is not None
         # 1.Goods must be shipped out from its origin to another node and shipped to its destination.
-        model.add_constraints(np.sum(self.x[self.kStartPort[k], :, :, k]) == 1 for k in range(self.goods))
-        model.add_constraints(np.sum(self.x[:, self.kEndPort[k], :, k]) == 1 for k in range(self.goods))
+        out, arr = i == start, j == end
+        add('origin', matrix(k[out], col[out], ones[out], self.goods), 'le' if window else 'eq',
+            np.ones(self.goods), goods)
+        add('destination', matrix(k[arr], col[arr], ones[arr], self.goods), 'le' if window else 'eq',
+            np.ones(self.goods), goods)
         # 2.For each goods k, it couldn't be shipped out from its destination or shipped to its origin.
-        model.add_constraints(np.sum(self.x[:, self.kStartPort[k], :, k]) == 0 for k in range(self.goods))
-        model.add_constraints(np.sum(self.x[self.kEndPort[k], :, :, k]) == 0 for k in range(self.goods))
+        out, arr = i == end, j == start
+        add('no return', matrix(k[arr], col[arr], ones[arr], self.goods), 'eq', np.zeros(self.goods), goods)
+        add('no departure', matrix(k[out], col[out], ones[out], self.goods), 'eq', np.zeros(self.goods), goods)
         # 3.constraint for transition point
-        for k in range(self.goods):
-            for j in range(self.portSpace):
-                if (j != self.kStartPort[k]) & (j != self.kEndPort[k]):
-                    model.add_constraint(np.sum(self.x[:, j, :, k]) == np.sum(self.x[j, :, :, k]))
+        arr, out = (j != start) & (j != end), (i != start) & (i != end)
+        add('transition', matrix(np.concatenate([inRow[arr], outRow[out]]), np.concatenate([col[arr], col[out]]),
+                                 np.concatenate([ones[arr], -ones[out]]), pairs), 'ge' if window else 'eq',
+            np.zeros(pairs), pairGoods)
+        # in a rolling window, goods leave the ports where they cannot end the window, their origin included
+        if window:
+            noStop = ~np.isfinite(self.terminalCost).ravel()
+            origin = np.arange(pairs) % self.portSpace == self.kStartPort[pairGoods]
+            stop = matrix(np.concatenate([inRow, outRow]), np.concatenate([col, col]), np.concatenate([ones, -ones]),
+                          pairs)
+            add('no stop', stop[noStop], 'le', -origin[noStop].astype(float), pairGoods[noStop])
         # 4.each goods can only be transitioned in or out of a port for at most once
-        model.add_constraints(np.sum(self.x[i, :, :, k]) <= 1 for k in range(self.goods) for i in range(self.portSpace))
-        model.add_constraints(np.sum(self.x[:, j, :, k]) <= 1 for k in range(self.goods) for j in range(self.portSpace))
+        add('single out', matrix(outRow, col, ones, pairs), 'le', np.ones(pairs), pairGoods)
+        add('single in', matrix(inRow, col, ones, pairs), 'le', np.ones(pairs), pairGoods)
         # 5.transition-out should be after transition-in
-        model.add_constraints(stayTime[j, k] >= 0 for j in range(self.portSpace) for k in range(self.goods))
+        add('stay time', sp.hstack([self.stayTimeOp, sp.csr_matrix((pairs, 2 * ny))], format='csr'), 'ge',
+            -self.stayTimeConst, np.arange(pairs) % self.goods)
         # 6.constraint for number of containers used
-        numCtn = np.dot(self.x, self.kVol) / self.ctnVol
-        model.add_constraints(self.y[i, j, t] - numCtn[i, j, t] >= 0 \
-                              for i in range(self.portSpace) for j in range(self.portSpace) for t in
-                              range(self.dateSpace) if not isinstance(self.y[i, j, t] - numCtn[i, j, t] >= 0, bool))
+        arc = np.arange(ny)
+        add('container', matrix(np.concatenate([arc, self.var_arc]), np.concatenate([nx + arc, col]),
+                                np.concatenate([np.ones(ny), -self.kVol[k] / self.ctnVol[i, j, 0]]), ny), 'ge',
+            np.zeros(ny), arcGoods)
         # 7. constraint to check whether a route is used
-        model.add_constraints(self.z[i, j, t] >= (np.sum(self.x[i, j, t, :]) * 10e-5) \
-                              for i in range(self.portSpace) for j in range(self.portSpace) for t in
-                              range(self.dateSpace) if
-                              not isinstance(self.z[i, j, t] >= (np.sum(self.x[i, j, t, :]) * 10e-5), bool))
+        add('route usage', matrix(np.concatenate([arc, self.var_arc]), np.concatenate([nx + ny + arc, col]),
+                                  np.concatenate([np.ones(ny), -ones * 10e-5]), ny), 'ge', np.zeros(ny), arcGoods)
         # 8.time limitation constraint for each goods
-        model.add_constraints(np.sum(arrTime[:, self.kEndPort[k], :, k]) <= self.kDDL[k] for k in range(self.goods)
-                              if not isinstance(np.sum(arrTime[:, self.kEndPort[k], :, k]) <= self.kDDL[k], bool))
+        add('deadline', sp.hstack([self.arrTimeOp, sp.csr_matrix((self.goods, 2 * ny))], format='csr'), 'le',
+            self.kDDL, goods)
 
-        self.objective = model.objective_expr
-        self.constraints = list(model.iter_constraints())
-        self.model = model
+        return constraints
 
-    def solve_model(self, solver=cp.CBC):
+    def solve_model(self, solver=cp.CBC, method='mip', warm_start=True, time_limit=None, mip_gap=None):
         '''
         solve the optimization model & cache the optimized objective value, route and arrival time for each goods.
+        The solver status, objective, best bound, gap and nodes are reported to the stats, and with DOCPLEX also the
+        progress of incumbent and bound during the solve.
         :param solver: the solver to use to solve the LP problem when framework is CVXPY, has no effect to the model
         when framework is DOCPLEX. Default solver is cvxpy.CBC, other open source solvers do not perform that well.
+        :param method: 'mip' to solve the built model with the framework, 'heuristic' to only construct a feasible
+        solution with heuristic_solution, which needs no built model and takes seconds. 'relaxation' and 'milp'
+        need no built model either and solve the model matrices with the HiGHS solver of scipy, see
+        relaxation_solution: 'relaxation' rounds the LP relaxation to a feasible plan with the heuristic guided by
+        the relaxed x, and keeps the relaxation objective as lower_bound, 'milp' solves the exact model. Both raise
+        when the solver stops without a solution, for 'relaxation' without the optimum of the relaxation.
+        :param warm_start: whether to feed a starting solution to the solver as a MIP start, the previous solution
+        after the model is changed in place (see update_model), otherwise the heuristic solution.
+        :param time_limit: time limit of the solver in seconds, the best solution found by then is kept.
+        :param mip_gap: relative MIP gap at which the solver stops. Limits are kept by a DOCPLEX model for later
+        solves, with CVXPY they are only supported for the solvers in solverOptions, and are used by 'milp'. CVXPY
+        solvers and 'milp' apply the gap to the objective without its constant part (tax and warehouse fee that no
+        decision changes), so they stop at another gap of the full objective than CPLEX. The stats report the gap of
+        the full objective in both frameworks.
         :return: None
         '''
-        try:
-            if self.framework == 'CVXPY':
-                self.objective_value = self.model.solve(solver)
-                self.xs = np.zeros((self.portSpace, self.portSpace, self.dateSpace, self.goods))
-                self.xs[self.var_location] = self.var.value
-                self.ys = np.zeros((self.portSpace, self.portSpace, self.dateSpace))
-                self.ys[self.var_2_location] = self.var_2.value
-                self.zs = np.zeros((self.portSpace, self.portSpace, self.dateSpace))
-                self.zs[self.var_3_location] = self.var_3.value
-
-            elif self.framework == 'DOCPLEX':
+        if method not in ['mip', 'heuristic', 'relaxation', 'milp']:
+            raise ValueError('Method not supported, the model only supports mip, heuristic, relaxation and milp')
+
+        if method == 'heuristic':
+            xs, ys, zs = self.heuristic_solution()
+        elif method in ['relaxation', 'milp']:
+            self.stats['progress'] = []
+            start = time.perf_counter()
+            values, self.lower_bound, record = self.relaxation_solution(method == 'milp', time_limit, mip_gap)
+            record['time'] = time.perf_counter() - start
+            # a relaxation stopped by the time limit has neither a bound nor relaxed values to guide the heuristic
+            if values is None or method == 'relaxation' and self.lower_bound is None:
+                self.report('solve_model', record)
+                raise Exception('Model is not solvable, no solution will be provided, solver status: ' +
+                                record['status'])
+            nx, ny = len(self.var_location[0]), len(self.var_2_location[0])
+            xs, ys, zs = (values[:nx], values[nx:nx + ny], values[nx + ny:]) if method == 'milp' else \
+                self.heuristic_solution(guide=values[:nx])
+
+        if method != 'mip':
+            # goods may stay at their origin in a rolling window
+            if self.windowEnd is None and \
+                    not np.all(np.bincount(self.var_location[3], weights=np.round(xs), minlength=self.goods)):
+                raise Exception('Model is not solvable, no solution will be provided')
+            if self.pinned is not None and not np.all(np.round(xs)[self.pinned] == 1):
+                raise Exception('Model is not solvable with the pinned legs, no solution will be provided')
+            self.set_solution(xs, ys, zs)
+            self.objective_value = self.transportCost + self.whCostFinal + self.taxCost
+            if method != 'heuristic':
+                gap = None if self.lower_bound is None else \
+                    abs(self.objective_value - self.lower_bound) / (1e-10 + abs(self.objective_value))
+                record.update({'objective': self.objective_value, 'time': time.perf_counter() - start, 'gap': gap})
+                self.report('solve_model', record)
+            return
+
+        if warm_start:
+            self.set_mip_start(*(self.mip_start or self.heuristic_solution()))
+            self.mip_start = None
+        self.stats['progress'] = []
+        start = time.perf_counter()
+        if self.framework == 'CVXPY':
+            options = {}
+            for option, value in zip(self.solverOptions.get(solver, (None, None)), [time_limit, mip_gap]):
+                if value is not None and option is None:
+                    raise ValueError('Time limit and MIP gap are not supported for solver ' + str(solver))
+                elif value is not None:
+                    options[option] = value
+            try:
+                self.objective_value = self.model.solve(solver, warm_start=warm_start, **options)
+            except Exception as e:
+                raise Exception('Model is not solvable, no solution will be provided') from e
+            xs, ys, zs = self.var.value, self.var_2.value, self.var_3.value
+            stats = self.model.solver_stats
+            # the solver bounds the objective without its constant part, the gap is taken against the full objective
+            # as CPLEX does
+            bound = getattr(stats.extra_stats, 'mip_dual_bound', None)
+            bound = None if bound is None else bound + self.objective_vector()[1]
+            gap = None if bound is None or xs is None else \
+                abs(self.objective_value - bound) / (1e-10 + abs(self.objective_value))
+            record = {'solver': stats.solver_name, 'status': self.model.status, 'objective': self.objective_value,
+                      'bound': bound, 'gap': gap, 'nodes': getattr(stats.extra_stats, 'mip_node_count', None),
+                      'iterations': stats.num_iters, 'solve_time': stats.solve_time}
+
+        elif self.framework == 'DOCPLEX':
+            if time_limit is not None:
+                self.model.parameters.timelimit = time_limit
+            if mip_gap is not None:
+                self.model.parameters.mip.tolerances.mipgap = mip_gap
+            listener = ProgressRecorder(self)
+            self.model.add_progress_listener(listener)
+            try:
                 ms = self.model.solve()
-                self.objective_value = self.model.objective_value
-                self.xs = np.zeros((self.portSpace, self.portSpace, self.dateSpace, self.goods))
-                self.xs[self.var_location] = ms.get_values(self.var)
-                self.ys = np.zeros((self.portSpace, self.portSpace, self.dateSpace))
-                self.ys[self.var_2_location] = ms.get_values(self.var_2)
-                self.zs = np.zeros((self.portSpace, self.portSpace, self.dateSpace))
-                self.zs[self.var_3_location] = ms.get_values(self.var_3)
-
-        except:
-            raise Exception('Model is not solvable, no solution will be provided')
-
-        nonzeroX = list(zip(*np.nonzero(self.xs)))
-        nonzeroX = sorted(nonzeroX, key=lambda x: x[2])
-        nonzeroX = sorted(nonzeroX, key=lambda x: x[3])
-        nonzeroX = list(map(lambda x: (self.portIndex[x[0]], self.portIndex[x[1]], \
-                                       (self.minDate + pd.to_timedelta(x[2], unit='days')).date().isoformat(),
-                                       x[3]), nonzeroX))
-
-        self.whCostFinal, arrTime, _ = self.warehouse_fee(self.xs)
-        self.transportCost = np.sum(self.ys * self.tranCost) + np.sum(self.zs * self.tranFixedCost)
-        self.taxCost = np.sum(self.taxPct * self.kValue) + \
-                       np.sum(np.sum(np.dot(self.xs, self.kValue), axis=2) * self.transitDuty)
-        self.solution_ = {}
-        self.arrTime_ = {}
-        for i in range(self.goods):
-            self.solution_['goods-' + str(i + 1)] = list(filter(lambda x: x[3] == i, nonzeroX))
-            self.arrTime_['goods-' + str(i + 1)] = (self.minDate + pd.to_timedelta \
-                (np.sum(arrTime[:, self.kEndPort[i], :, i]), unit='days')).date().isoformat()
+            except Exception as e:
+                raise Exception('Model is not solvable, no solution will be provided') from e
+            finally:
+                self.model.remove_progress_listener(listener)
+            xs, ys, zs = (None, None, None) if ms is None else \
+                (ms.get_values(self.var), ms.get_values(self.var_2), ms.get_values(self.var_3))
+            self.objective_value = None if ms is None else self.model.objective_value
+            details = self.model.solve_details
+            record = {'solver': 'CPLEX', 'status': details.status, 'objective': self.objective_value,
+                      'bound': details.best_bound, 'gap': details.mip_relative_gap,
+                      'nodes': details.nb_nodes_processed, 'iterations': details.nb_iterations,
+                      'solve_time': details.time}
+
+        record['time'] = time.perf_counter() - start
+        self.report('solve_model', record)
+        if xs is None:
+            raise Exception('Model is not solvable, no solution will be provided, solver status: ' + record['status'])
+        self.set_solution(xs, ys, zs)
+
+    def solve_decomposed(self, solver=cp.CBC, method='mip', warm_start=True, processes=None):
+        '''
+        split the goods into clusters that share no departure (see clusters), solve the sub-problem of each cluster
+        in a process pool, and merge the sub-solutions into the cached objective value, route and arrival time for
+        each goods, as solve_model does. No model needs to be built before.
+        :param solver, method, warm_start: passed on to solve_model of each sub-problem.
+        :param processes: the number of worker processes, default to the number of CPUs.
+        :return: None
+        '''
+
+        labels = self.clusters()
+        goods = [np.nonzero(labels == c)[0] for c in range(np.max(labels, initial=-1) + 1)]
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(solve_cluster, [self.subproblem(g) for g in goods],
+                                    repeat(solver), repeat(method), repeat(warm_start)))
+
+        xs = np.zeros(len(self.var_location[0]))
+        ys = np.zeros(len(self.var_2_location[0]))
+        zs = np.zeros(len(self.var_3_location[0]))
+        for c, (_, xc, yc, zc) in enumerate(results):
+            # sub-problems keep the variables of their goods, and the departures, in the same order
+            var = np.nonzero(labels[self.var_location[3]] == c)[0]
+            xs[var] = xc
+            ys[np.unique(self.var_arc[var])] = yc
+            zs[np.unique(self.var_arc[var])] = zc
+        self.set_solution(xs, ys, zs)
+        self.objective_value = sum(r[0] for r in results)
+
+    def solve_rolling(self, window, step=None, solver=cp.CBC, method='mip', warm_start=True):
+        '''
+        solve the model over a rolling horizon and cache the objective value, route and arrival time for each goods,
+        as solve_model does. Each window of the given days solves the goods ready to leave a port within it, over
+        the departures within the window only, then commits their departures before the next window. Goods that
+        cannot reach their destination in a window end it at any port, where they stay until the end of the window
+        and pay the cost of the rest of their way (see cost_to_go). Goods still in a warehouse or in transit are
+        carried into the next window from the port and date of their last committed arrival, and can neither depart
+        before the window nor go back to a port they visited. The pinned legs (see pin_legs) are committed before the
+        first window. The last window plans and commits everything up to the deadlines. The number of goods,
+        variables and time of each window are reported to the stats as 'rolling'. No model needs to be built before.
+        :param window: length of a window in days.
+        :param step: days between the start of two windows, the committed part of a window. Default to half the
+        window, so that consecutive windows overlap.
+        :param solver, method, warm_start: passed on to solve_model of each window.
+        :return: None
+        '''
+
+        step = step or max(window // 2, 1)
+        i, j, t, k = self.var_location
+        # the variable index sorted by (start port, end port, time, goods), to find committed departures
+        key = np.ravel_multi_index(self.var_location, (self.portSpace, self.portSpace, self.dateSpace, self.goods))
+        order = np.argsort(key)
+
+        port, ready = self.kStartPort.copy(), self.kStartTime.copy()
+        visited = np.zeros((self.goods, self.portSpace), dtype=bool)
+        visited[range(self.goods), port] = True
+        xs = np.zeros(len(k))
+
+        def commit(var):
+            '''commit variables of the index in order of departure and carry their goods from the last arrival.'''
+            xs[var] = 1
+            visited[k[var], j[var]] = True
+            _, lastLeg = np.unique(k[var][::-1], return_index=True)
+            var = var[::-1][lastLeg]
+            port[k[var]] = j[var]
+            ready[k[var]] = t[var] + self.tranTime[i[var], j[var], t[var]]
+            return port == self.kEndPort
+
+        # legs already dispatched (see pin_legs) are committed before the first window
+        pinned = np.zeros(0, dtype=int) if self.pinned is None else np.nonzero(self.pinned)[0]
+        done = commit(pinned[np.argsort(t[pinned], kind='stable')])
+        windows = []
+        begin = time.perf_counter()
+        start = 0
+        while not done.all():
+            last = start + window >= self.dateSpace
+            goods = np.nonzero(~done & (ready < start + window))[0]
+            start += step
+            if len(goods) == 0:
+                continue
+
+            clock = time.perf_counter()
+            sub = self.subproblem(goods)
+            sub.kStartPort, sub.kStartTime = port[goods], ready[goods]
+            si, sj, st, sk = sub.var_location
+            sub.keep_vars((st >= start - step) & ~visited[goods[sk], sj])
+            # pruned over the whole horizon first, so that every port kept still leads to the destination in time
+            sub.prune_routes()
+            if not last:
+                # goods can end the window at the ports they can still leave after the committed part of the window
+                si, _, st, sk = sub.var_location
+                latest = np.full((sub.goods, self.portSpace), -1)
+                np.maximum.at(latest, (sk, si), st)
+                end = (latest >= start) | (np.arange(self.portSpace) == sub.kEndPort[:, None])
+                sub.windowEnd, sub.terminalCost = start - step + window, np.where(end, sub.cost_to_go(), np.inf)
+                sub.keep_vars(sub.var_location[2] < sub.windowEnd)
+                if len(sub.var_location[0]) == 0:
+                    # nothing departs in the window, the goods wait for the next one
+                    continue
+            if method == 'mip':
+                sub.build_model()
+            sub.solve_model(solver, method, warm_start)
+            windows.append({'start': start - step, 'goods': len(goods), 'x': len(sub.var_location[0]),
+                            'y': len(sub.var_2_location[0]), 'time': time.perf_counter() - clock})
+
+            # commit the departures before the next window
+            si, sj, st, sk = sub.var_location
+            var = np.nonzero(sub.xs > 0.5)[0]
+            var = var[np.argsort(st[var], kind='stable')]
+            if not last:
+                var = var[st[var] < start]
+            done = commit(order[np.searchsorted(key[order], np.ravel_multi_index(
+                (si[var], sj[var], st[var], goods[sk[var]]), (self.portSpace, self.portSpace, self.dateSpace,
+                                                                self.goods)))])
+
+        self.set_solution(xs, *self.container_solution(xs))
+        self.objective_value = self.transportCost + self.whCostFinal + self.taxCost
+        self.report('rolling', {'time': time.perf_counter() - begin, 'windows': windows})
+
+    def solve_scenarios(self, scenarios, solver=cp.CBC, method='mip', processes=None, time_limit=None, mip_gap=None):
+        '''
+        solve a batch of what-if scenarios of the route parameters (see set_scenario) in a process pool. Every worker
+        process builds the model once, then only changes its objective coefficients and variable bounds for each
+        scenario before solving it again. The model itself is left unchanged.
+        :param scenarios: dict of the scenarios by name.
+        :param solver, method, time_limit, mip_gap: passed on to solve_model of each scenario.
+        :param processes: the number of worker processes, default to the number of CPUs.
+        :return: data frame of the transportation, warehouse, tax and total cost and the time of each scenario by
+        name, with the error of the scenarios that are not solvable.
+        '''
+
+        base = MMT(self.framework)
+        base.__dict__.update({name: value for name, value in self.__dict__.items() if name not in self.builtState})
+        # check the scenarios before starting the workers
+        for scenario in scenarios.values():
+            base.scenario_param(scenario)
+        with ProcessPoolExecutor(processes, initializer=scenario_worker, initargs=(base, method)) as pool:
+            rows = list(pool.map(solve_scenario, scenarios.values(), repeat(solver), repeat(method),
+                                 repeat(time_limit), repeat(mip_gap)))
+
+        return pd.DataFrame(rows, index=pd.Index(list(scenarios), name='Scenario'))
+
+    def clusters(self):
+        '''label the goods with independent clusters. Goods in different clusters have no departure in common so
+        they never share containers, and the model decomposes into one sub-problem per cluster.
+        :return: the cluster label of each goods, from 0 to the number of clusters - 1.
+        '''
+
+        k, arcs = self.var_location[3], self.var_arc
+        # bipartite graph of goods and departures, linked by the decision variables
+        graph = sp.coo_matrix((np.ones(len(k)), (k, self.goods + arcs)),
+                              shape=(self.goods + len(self.var_2_location[0]),) * 2)
+        _, labels = connected_components(graph, directed=False)
+        # number clusters in order of their first goods
+        _, labels = np.unique(labels[:self.goods], return_inverse=True)
+
+        return labels
+
+    def subproblem(self, goods):
+        '''return a new model of the same framework over a subset of the goods, sharing the route parameters.
+        :param goods: indexes of the goods, in increasing order.
+        '''
+
+        sub = MMT(self.framework)
+        for name in ['portSpace', 'dateSpace', 'indexPort', 'portIndex', 'maxDate', 'minDate', 'tranCost',
+                     'tranFixedCost', 'tranTime', 'ctnVol', 'whCost', 'transitDuty', 'route_num', 'available_routes',
+                     'scenario']:
+            setattr(sub, name, getattr(self, name))
+        for name in self.goodsParam:
+            setattr(sub, name, getattr(self, name)[goods])
+        sub.goods = len(goods)
+
+        index = np.full(self.goods, -1)
+        index[goods] = np.arange(len(goods))
+        keep = index[self.var_location[3]] >= 0
+        sub.var_location = tuple(v[keep] for v in self.var_location[:3]) + (index[self.var_location[3][keep]],)
+        sub.pinned = None if self.pinned is None else self.pinned[keep]
+        sub.set_var_2_location()
+
+        return sub
+
+    def set_mip_start(self, xs, ys, zs):
+        '''give the built model a starting solution, as MIP start in DOCPLEX and as variable values in CVXPY.'''
+
+        if self.framework == 'CVXPY':
+            self.var.value, self.var_2.value, self.var_3.value = xs, ys, zs
+        elif self.framework == 'DOCPLEX':
+            dvars = self.var + self.var_2 + self.var_3
+            values = np.concatenate([xs, ys, zs])
+            start = self.model.new_solution({dvars[n]: values[n] for n in np.nonzero(values)[0]})
+            self.model.clear_mip_starts()
+            self.model.add_mip_start(start)
+
+    def set_solution(self, xs, ys, zs):
+        '''cache the solution, route and arrival time for each goods and cost breakdown from the flat x, y and z
+        values over the variable index. The solution values are kept flat in xs, ys and zs.'''
+
+        start = time.perf_counter()
+        self.xs, self.ys, self.zs = np.round(xs), np.round(ys), np.round(zs)
+        _, arrTime, _ = self.warehouse_fee(self.xs)
+        # cost breakdown under the scenario of the model
+        values = np.concatenate([self.xs, self.ys, self.zs])
+        costs = self.cost_vectors()
+        self.transportCost, self.whCostFinal, self.taxCost = (costs[name][0] @ values + costs[name][1]
+                                                              for name in ['transport', 'warehouse', 'tax'])
+
+        # legs of all goods from a single sort, then split goods by goods
+        legs = self.solution_legs()
+        i, j, t, k = (v[legs] for v in self.var_location)
+        ports = np.array([self.portIndex[p] for p in range(self.portSpace)], dtype=object)
+        legs = list(zip(ports[i], ports[j], self.iso_dates(t), k.tolist()))
+        bounds = np.searchsorted(k, np.arange(self.goods + 1))
+        arrDate = self.iso_dates(arrTime)
+        self.solution_ = {'goods-' + str(g + 1): legs[bounds[g]:bounds[g + 1]] for g in range(self.goods)}
+        self.arrTime_ = {'goods-' + str(g + 1): arrDate[g] for g in range(self.goods)}
+        self.report('set_solution', {'time': time.perf_counter() - start})
+
+    def solution_legs(self):
+        '''return the variables of the legs in the cached solution, goods by goods in order of departure date.'''
+
+        i, j, t, k = self.var_location
+        legs = np.nonzero(self.xs > 0.5)[0]
+
+        return legs[np.lexsort((j[legs], i[legs], t[legs], k[legs]))]
+
+    def iso_dates(self, days):
+        '''return the dates of days counted from the first order date, as ISO strings.'''
+
+        dates = np.datetime64(self.minDate.date()) + np.asarray(days, dtype=int).astype('timedelta64[D]')
+
+        return np.datetime_as_string(dates, unit='D').tolist()
+
+    def solution_frames(self, size=100000):
+        '''yield the legs of the cached solution as data frames of at most the given number of legs, goods by goods
+        in order of departure date, with the goods and leg number, start and end port and departure and arrival
+        date of each leg. Dates and port names are only made for the legs of one frame at a time.
+        :param size: number of legs in each data frame.
+        '''
+
+        legs = self.solution_legs()
+        i, j, t, k = (v[legs] for v in self.var_location)
+        ports = np.array([self.portIndex[p] for p in range(self.portSpace)], dtype=object)
+        # legs of a goods are contiguous, numbered from its first leg
+        leg = np.arange(len(legs)) - np.searchsorted(k, k) + 1
+        for n in range(0, max(len(legs), 1), size):
+            part = slice(n, n + size)
+            yield pd.DataFrame({'Goods': k[part] + 1, 'Leg': leg[part], 'From': ports[i[part]], 'To': ports[j[part]],
+                                'Departure Date': self.iso_dates(t[part]),
+                                'Arrival Date': self.iso_dates(t[part] + self.tranTime[i[part], j[part], t[part]])})
+
+    def iter_solution(self, size=100000):
+        '''yield the legs of the cached solution one by one as dicts, see solution_frames.'''
+
+        for frame in self.solution_frames(size):
+            yield from frame.to_dict('records')
+
+    def write_solution(self, filePath, size=100000):
+        '''write the legs of the cached solution to a CSV, JSON or Parquet file by its extension, one data frame of
+        legs at a time (see solution_frames). A JSON file holds an array of records.
+        :param filePath: path of the .csv, .json or .parquet file.
+        :param size: number of legs written at a time.
+        :return: None
+        '''
+
+        extension = os.path.splitext(filePath)[1].lower()
+        if extension not in ['.csv', '.json', '.parquet']:
+            raise ValueError('File type not supported, the solution can only be written to CSV, JSON and Parquet')
+
+        frames = self.solution_frames(size)
+        if extension == '.parquet':
+            # pyarrow is only needed to write Parquet files
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            writer = None
+            try:
+                for frame in frames:
+                    table = pa.Table.from_pandas(frame, preserve_index=False)
+                    writer = writer or pq.ParquetWriter(filePath, table.schema)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            return
+
+        with open(filePath, 'w', newline='') as file:
+            if extension == '.json':
+                file.write('[')
+            for n, frame in enumerate(frames):
+                if extension == '.csv':
+                    frame.to_csv(file, header=n == 0, index=False)
+                else:
+                    file.write((',' if n else '') + frame.to_json(orient='records')[1:-1])
+            if extension == '.json':
+                file.write(']')
+
+    def add_orders(self, order):
+        '''add goods to the model in place, numbered after the existing goods. Their order date and deadline must
+        lie in the horizon of the model.
+        :param order: order information of the new goods, in the same form as the order given to set_param.
+        :return: None
+        '''
+
+        param = self.goods_param(order)
+        if np.any(param['kStartTime'] < 0) or np.any(param['kDDL'] > self.dateSpace):
+            raise ValueError('Order dates out of the model horizon, parameters need to be set again with set_param')
+
+        location, route = self.var_location, self.var_2_location
+        goods = np.arange(self.goods, self.goods + order.shape[0])
+        for name, value in param.items():
+            setattr(self, name, np.concatenate([getattr(self, name), value]))
+        self.goods += order.shape[0]
+        added, pruned = self.goods_var_location(goods, self.pruned is not None)
+        self.var_location = tuple(np.concatenate(v) for v in zip(location, added))
+        if self.pinned is not None:
+            self.pinned = np.concatenate([self.pinned, np.zeros(len(added[0]), dtype=bool)])
+        self.set_var_2_location()
+        if self.pruned is not None:
+            self.pruned += pruned
+        self.update_model(location, route, np.arange(goods[0]))
+
+    def remove_orders(self, goods):
+        '''remove goods from the model in place, the remaining goods are numbered again in order.
+        :param goods: indexes of the goods to remove.
+        :return: None
+        '''
+
+        keep = np.ones(self.goods, dtype=bool)
+        keep[goods] = False
+        goodsMap = np.where(keep, np.cumsum(keep) - 1, -1)
+
+        location, route = self.var_location, self.var_2_location
+        for name in self.goodsParam:
+            setattr(self, name, getattr(self, name)[keep])
+        self.goods = np.count_nonzero(keep)
+        keep = keep[location[3]]
+        self.var_location = tuple(v[keep] for v in location[:3]) + (goodsMap[location[3][keep]],)
+        if self.pinned is not None:
+            self.pinned = self.pinned[keep]
+        self.set_var_2_location()
+        self.update_model(location, route, goodsMap)
+
+    def disable_route(self, source, destination, dates=None):
+        '''cancel the departures of a route in place, on every day or on the given dates.
+        :param source: start port of the route, as named in the route information.
+        :param destination: end port of the route, as named in the route information.
+        :param dates: dates of the cancelled departures, default to all dates.
+        :return: None
+        '''
+
+        unknown = [str(port) for port in [source, destination] if port not in self.indexPort]
+        if unknown:
+            raise ValueError('Route port without feasible routes: ' + ', '.join(unknown))
+        i, j = self.indexPort[source], self.indexPort[destination]
+        days = np.arange(self.dateSpace) if dates is None else \
+            np.array((pd.to_datetime(pd.Series(dates)) - self.minDate).dt.days)
+        days = days[(days >= 0) & (days < self.dateSpace)]
+        # the cancelled departures are also taken out of the schedule for the goods added later
+        for name in ['tranCost', 'tranFixedCost', 'tranTime']:
+            tensor = getattr(self, name)
+            if isinstance(tensor, np.ndarray) and not tensor.flags.writeable:
+                # tensors mapped from the cache are shared, change a copy
+                tensor = np.array(tensor)
+                setattr(self, name, tensor)
+            tensor[i, j, days] = self.bigM
+
+        location, route = self.var_location, self.var_2_location
+        self.keep_vars(~((location[0] == i) & (location[1] == j) & np.isin(location[2], days)))
+        if self.pruned is not None:
+            self.pruned += self.prune_routes()
+        self.update_model(location, route, np.arange(self.goods))
+
+    def pin_legs(self, date):
+        '''pin the legs of the last solution that depart before a date, as they are already dispatched, so that
+        the next solve can only change the legs after.
+        :param date: the first date that is not dispatched yet.
+        :return: None
+        '''
+
+        if self.xs is None:
+            raise ValueError('No solution to pin legs of, the model needs to be solved first')
+        pinned = (self.xs > 0.5) & (self.var_location[2] < (pd.Timestamp(date) - self.minDate).days)
+        self.pinned = pinned if self.pinned is None else self.pinned | pinned
+        self.update_model(self.var_location, self.var_2_location, np.arange(self.goods))
+
+    def update_model(self, location, route, goodsMap):
+        '''carry the built model and the last solution over to a changed variable index, where new decision
+        variables only belong to new goods. The pinned legs follow the index as it changes and are pinned in the
+        model again. The DOCPLEX model is changed in place: the variables and constraints of new goods and
+        departures are added and new variables join the constraints of their existing departure, the constraints of
+        removed goods and departures are removed, and removed variables are fixed to 0 as DOCPLEX cannot delete
+        them. A CVXPY problem cannot be changed and is built again. The last solution, without the removed
+        variables, is cached over the new index and becomes the MIP start of the next solve.
+        :param location: the variable index before the change.
+        :param route: the departures of the container number and route usage variables before the change.
+        :param goodsMap: the new index of each goods before the change, -1 for removed goods.
+        :return: None
+        '''
+
+        def match(old, new):
+            '''position of each new key among the old keys, -1 if not found.'''
+            order = np.argsort(old)
+            pos = np.minimum(np.searchsorted(old[order], new), max(len(old) - 1, 0))
+            return np.where(old[order][pos] == new, order[pos], -1) if len(old) else np.full(len(new), -1)
+
+        shape = (self.portSpace, self.portSpace, self.dateSpace)
+        i, j, t, k = location
+        oldKey = np.where(goodsMap[k] >= 0, np.ravel_multi_index((i, j, t), shape) * self.goods + goodsMap[k], -1)
+        i, j, t, k = self.var_location
+        prev = match(oldKey, np.ravel_multi_index((i, j, t), shape) * self.goods + k)
+        prevArc = match(np.ravel_multi_index(route, shape), np.ravel_multi_index(self.var_2_location, shape))
+
+        if self.xs is not None:
+            # the cached solution follows the index, so that the next change or pin_legs reads it over this one
+            xs = np.where(prev >= 0, self.xs[prev], 0)
+            self.mip_start = (xs,) + self.container_solution(xs)
+            self.xs, self.ys, self.zs = self.mip_start
+        if self.model is None:
+            return
+        if self.framework == 'CVXPY':
+            self.build_model()
+            return
+
+        model = self.model
+        # fix the removed variables to 0 and remove the constraints of removed goods and departures
+        kept, keptArc = np.zeros(len(oldKey), dtype=bool), np.zeros(len(route[0]), dtype=bool)
+        kept[prev[prev >= 0]], keptArc[prevArc[prevArc >= 0]] = True, True
+        model.change_var_upper_bounds([self.var[n] for n in np.nonzero(~kept)[0]] +
+                                      [v[n] for v in (self.var_2, self.var_3) for n in np.nonzero(~keptArc)[0]], 0)
+        model.remove_constraints([ct for n in np.nonzero(~keptArc)[0] for ct in self.arc_rows[n]] +
+                                 [ct for g in np.nonzero(goodsMap < 0)[0] for ct in self.goods_rows[g]])
+        # add the new variables
+        new, newArc = prev < 0, prevArc < 0
+        added = iter(model.binary_var_list(np.count_nonzero(new)))
+        self.var = [self.var[n] if n >= 0 else next(added) for n in prev]
+        added = iter(model.integer_var_list(np.count_nonzero(newArc)))
+        self.var_2 = [self.var_2[n] if n >= 0 else next(added) for n in prevArc]
+        added = iter(model.binary_var_list(np.count_nonzero(newArc)))
+        self.var_3 = [self.var_3[n] if n >= 0 else next(added) for n in prevArc]
+        dvars = self.var + self.var_2 + self.var_3
+        if self.pinned is not None and self.pinned.any():
+            model.change_var_lower_bounds([self.var[n] for n in np.nonzero(self.pinned)[0]], 1)
+        ###objective###
+        coef, constant = self.objective_vector()
+        for n in np.nonzero(np.concatenate([new, newArc, newArc]))[0]:
+            model.objective_expr.add_term(dvars[n], coef[n])
+        model.objective_expr.constant = constant
+        ###constraint###
+        goodsRows = [[] for _ in range(self.goods)]
+        for g in np.nonzero(goodsMap >= 0)[0]:
+            goodsRows[goodsMap[g]] = self.goods_rows[g]
+        self.goods_rows = goodsRows
+        self.arc_rows = [self.arc_rows[n] if n >= 0 else [] for n in prevArc]
+        newGoods = np.array([len(rows) == 0 for rows in self.goods_rows])
+        # new variables on existing departures
+        joined = np.nonzero(new & ~newArc[self.var_arc])[0]
+        family = 0
+        for name, A, sense, rhs, goods in self.constraint_matrix():
+            depart = np.any(goods < 0)
+            rows = newArc if depart else newGoods[goods]
+            cts = model.add_constraints(model.matrix_constraints(A[rows], dvars, rhs[rows], sense))
+            for n, (g, ct) in zip(np.nonzero(rows)[0], zip(goods[rows], cts)):
+                (self.goods_rows[g] if g >= 0 else self.arc_rows[n]).append(ct)
+            if depart:
+                for n, c in zip(joined, np.asarray(A[self.var_arc[joined], joined]).ravel()):
+                    self.arc_rows[self.var_arc[n]][family].lhs.add_term(self.var[n], c)
+                family += 1
+
+        self.objective = model.objective_expr
+        self.constraints = list(model.iter_constraints())
+        if self.scenario is not None:
+            self.update_objective()
+
+    def relaxation_solution(self, integral=False, time_limit=None, mip_gap=None):
+        '''solve the linear relaxation of the model over the model matrices (see objective_vector and
+        constraint_matrix) with the HiGHS solver of scipy, or the model itself when integral. Needs no framework.
+        The stay time and deadline rows, whose coefficients are dates, are replaced by the balance of the legs and
+        waiting arcs of the time-expanded network (see waiting_arcs) and by fixing the late arrivals at the
+        destination to 0, which gives the same integral solutions and a tighter relaxation with coefficients of 1
+        and -1 only.
+        :param integral: whether x, y and z are kept integral, otherwise they are relaxed to continuous values.
+        :param time_limit: time limit of the solver in seconds.
+        :param mip_gap: relative MIP gap at which the solver stops, when integral.
+        :return: flat x, y and z values over [x, y, z] (None if no solution is found), lower bound of the objective
+        and the solver record for the stats.
+        '''
+        i, j, t, k = self.var_location
+        nx, ny = len(k), len(self.var_2_location[0])
+        costs = self.cost_vectors()
+        # the warehouse fee is charged on the waiting arcs rather than telescoped over the dates of the legs
+        del costs['warehouse']
+        legs, waits, supply, waitCost, waitUpper = self.waiting_arcs()
+        nw = len(waitCost)
+        coef = np.concatenate([sum(coef for coef, _ in costs.values()), waitCost])
+        constant = sum(constant for _, constant in costs.values())
+        lower = np.zeros(nx + 2 * ny + nw)
+        if self.pinned is not None:
+            lower[:nx] = self.pinned
+        upper = np.concatenate([np.ones(nx), np.full(ny, np.inf), np.ones(ny), waitUpper])
+        upper[:nx + 2 * ny][self.closed_vars()] = 0
+        upper[:nx][(j == self.kEndPort[k]) & (t + self.tranTime[i, j, t] > self.kDDL[k])] = 0
+        rows = [(A, sense, rhs) for name, A, sense, rhs, _ in self.constraint_matrix()
+                if name not in ['route usage', 'stay time', 'deadline']]
+        # route usage as z >= x of each variable rather than z >= 10e-5 * sum of x of each departure, which is both
+        # tighter and well scaled
+        rows.append((sp.hstack([sp.identity(nx), sp.csr_matrix((nx, ny)),
+                                sp.csr_matrix((-np.ones(nx), (np.arange(nx), self.var_arc)), shape=(nx, ny))]),
+                     'le', np.zeros(nx)))
+        rows = [(sp.hstack([A, sp.csr_matrix((A.shape[0], nw))]), sense, rhs) for A, sense, rhs in rows]
+        rows.append((sp.hstack([legs, sp.csr_matrix((legs.shape[0], 2 * ny)), waits]), 'eq', supply))
+        constraints = [LinearConstraint(A, {'ge': rhs, 'eq': rhs, 'le': -np.inf}[sense],
+                                        {'ge': np.inf, 'eq': rhs, 'le': rhs}[sense])
+                       for A, sense, rhs in rows if A.shape[0]]
+        options = {name: value for name, value in [('time_limit', time_limit), ('mip_rel_gap', mip_gap)]
+                   if value is not None and (integral or name == 'time_limit')}
+
+        if integral:
+            result = milp(coef, integrality=np.arange(len(coef)) < nx + 2 * ny, bounds=Bounds(lower, upper),
+                          constraints=constraints, options=options)
+            bound = getattr(result, 'mip_dual_bound', None)
+            nodes = getattr(result, 'mip_node_count', None)
+        else:
+            A = sp.vstack([c.A for c in constraints], format='csr')
+            lb, ub = np.concatenate([c.lb for c in constraints]), np.concatenate([c.ub for c in constraints])
+            eq, ge, le = lb == ub, np.isfinite(lb) & (lb != ub), np.isfinite(ub) & (lb != ub)
+            result = linprog(coef, A_ub=sp.vstack([A[le], -A[ge]]), b_ub=np.concatenate([ub[le], -lb[ge]]),
+                             A_eq=A[eq], b_eq=lb[eq], bounds=np.column_stack([lower, upper]), method='highs',
+                             options=options)
+            bound = result.fun if result.status == 0 else None
+            nodes = None
+        record = {'solver': 'HiGHS (scipy)', 'status': result.message, 'objective': None,
+                  'bound': None if bound is None else bound + constant, 'gap': getattr(result, 'mip_gap', None),
+                  'nodes': nodes}
+
+        return None if result.x is None else result.x[:nx + 2 * ny], record['bound'], record
+
+    def waiting_arcs(self):
+        '''express the stay of the goods at each port but their destination as a flow over the time-expanded network,
+        with a node for each date a goods can arrive at or leave a port, its order date at origin and the end of a
+        rolling window included, and a waiting arc from each node to the next node of the port and goods. Legs and
+        waiting arcs balance at each node, so that goods leave a port no earlier than they arrive. In a rolling window
+        goods end it at a port over the arc out of its last node, the end of the window, where they may stop.
+        :return: balance rows of the nodes over x and over the waiting arcs, the supply of each node, 1 at the order
+        date at origin, and the warehouse fee and upper bound of each waiting arc.
+        '''
+
+        i, j, t, k = self.var_location
+        col = np.arange(len(k))
+        window = self.windowEnd is not None
+        arrTime = t + self.tranTime[i, j, t]
+        if window:
+            # goods arriving after the end of the window stay nowhere within it
+            arrTime = np.minimum(arrTime, self.windowEnd)
+        out, arr = i != self.kEndPort[k], j != self.kEndPort[k]
+        # events of (port, goods) pairs, numbered as in stayTimeOp, at the dates of legs out, legs in and order dates
+        pair = np.concatenate([(i * self.goods + k)[out], (j * self.goods + k)[arr],
+                               self.kStartPort * self.goods + np.arange(self.goods)])
+        date = np.concatenate([t[out], arrTime[arr], self.kStartTime])
+        if window:
+            pairs = np.unique(pair)
+            pair, date = np.concatenate([pair, pairs]), np.concatenate([date, np.full(len(pairs), self.windowEnd)])
+        span = int(date.max()) + 1
+        node, index = np.unique(pair * span + date, return_inverse=True)
+        nodePair, nodeDate = node // span, node % span
+        # a waiting arc leaves each node but the last one of its pair, in a rolling window the last one too
+        last = np.append(nodePair[1:] != nodePair[:-1], True)
+        wait = np.nonzero(~last | window)[0]
+        onward = ~last[wait]
+        nOut, nArr, nw = np.count_nonzero(out), np.count_nonzero(arr), len(wait)
+        legs = sp.csr_matrix((np.concatenate([np.ones(nOut), -np.ones(nArr)]),
+                              (index[:nOut + nArr], np.concatenate([col[out], col[arr]]))), shape=(len(node), len(k)))
+        waits = sp.csr_matrix((np.concatenate([np.ones(nw), -np.ones(np.count_nonzero(onward))]),
+                               (np.concatenate([wait, wait[onward] + 1]),
+                                np.concatenate([np.arange(nw), np.nonzero(onward)[0]]))), shape=(len(node), nw))
+        supply = np.bincount(index[nOut + nArr:nOut + nArr + self.goods], minlength=len(node)).astype(float)
+        # the fee of a waiting arc is the warehouse cost of its days, the stop at the end of a window is free
+        factor = self.scenario or self.scenario_param({})
+        whCost = np.outer(self.whCost * factor['whCost'], self.kVol).ravel()
+        days = np.where(onward, nodeDate[np.minimum(wait + 1, len(node) - 1)] - nodeDate[wait], 0)
+        upper = np.ones(nw)
+        if window:
+            stop = nodePair[wait[~onward]]
+            upper[~onward] = np.isfinite(self.terminalCost[stop % self.goods, stop // self.goods])
+
+        return legs, waits, supply, days * whCost[nodePair[wait]], upper
+
+    def heuristic_solution(self, rounds=3, guide=None):
+        '''construct a feasible solution fast. Every goods is first routed on its cheapest deadline-feasible path of
+        the time-expanded network as if it travelled alone, then goods are taken out and re-routed one by one
+        (largest volume first), paying only the marginal container and fixed cost of departures already used by
+        other goods, until no goods changes its path or after the given rounds of consolidation.
+        :param guide: flat x values over the variable index of a relaxed solution, to round. In the first round, the
+        cost of each variable is discounted by its value, so that goods start on the paths the relaxation uses most.
+        :return: flat x, y and z values over the variable index, x of goods without feasible path are all 0.
+        '''
+
+        start = time.perf_counter()
+        i, j, t, k = self.var_location
+        route = self.var_2_location
+        ctnVol = self.ctnVol[route[0], route[1], 0]
+        # cost of a decision variable other than the containers, i.e. transit duty and warehouse fee, and cost of a
+        # container and fixed cost of each departure
+        coef, _ = self.objective_vector()
+        varCost, tranCost, tranFixedCost = np.split(coef, [len(k), len(k) + len(ctnVol)])
+        # departures closed by the scenario are never taken
+        varCost = np.where(self.closed_vars()[:len(k)], np.inf, varCost)
+        bounds = np.searchsorted(k, np.arange(self.goods + 1))
+
+        load = np.zeros(len(ctnVol))
+        paths = [None] * self.goods
+        for n in range(rounds + 1):
+            changed = False
+            for g in np.argsort(-self.kVol, kind='stable'):
+                var = np.arange(bounds[g], bounds[g + 1])
+                arcs = self.var_arc[var]
+                if paths[g] is not None:
+                    np.subtract.at(load, self.var_arc[paths[g]], self.kVol[g])
+                # departures are costed empty in the first round, with the load of other goods afterwards
+                arcLoad = load[arcs] if n else np.zeros(len(arcs))
+                numCtn = np.ceil((arcLoad + self.kVol[g]) / ctnVol[arcs] - 1e-9) - np.ceil(arcLoad / ctnVol[arcs] - 1e-9)
+                cost = varCost[var] + numCtn * tranCost[arcs] + (arcLoad == 0) * tranFixedCost[arcs]
+                if n == 0 and guide is not None:
+                    cost = cost * (1 - np.clip(guide[var], 0, 1))
+                path = self.cheapest_path(g, cost)
+                if path is None:
+                    path = paths[g]
+                changed |= paths[g] is None or not np.array_equal(path, paths[g])
+                paths[g] = path
+                if n and path is not None:
+                    np.add.at(load, self.var_arc[path], self.kVol[g])
+            if n == 0:
+                for g in range(self.goods):
+                    if paths[g] is not None:
+                        np.add.at(load, self.var_arc[paths[g]], self.kVol[g])
+            elif not changed:
+                break
+
+        xs = np.zeros(len(k))
+        xs[np.concatenate([p for p in paths if p is not None] + [np.zeros(0, dtype=int)])] = 1
+        self.report('heuristic', {'time': time.perf_counter() - start, 'rounds': n,
+                                  'routed': sum(p is not None for p in paths)})
+
+        return (xs,) + self.container_solution(xs)
+
+    def container_solution(self, xs):
+        '''return the fewest containers and the route usage each departure needs to carry the goods of x.'''
+
+        route = self.var_2_location
+        load = np.bincount(self.var_arc, weights=xs * self.kVol[self.var_location[3]], minlength=len(route[0]))
+        ys = np.ceil(load / self.ctnVol[route[0], route[1], 0] - 1e-9)
+        zs = (load > 0).astype(float)
+
+        return ys, zs
+
+    def cheapest_path(self, goods, cost):
+        '''return the variables on the cheapest path of a goods from its origin to its destination in the
+        time-expanded network, where a departure can be taken any day after the arrival at its start port. A path
+        that goes through a port twice is repaired by banning the departure back into the port and searching again.
+        The pinned legs of the goods (see pin_legs) are kept as the start of the path, which is searched on from
+        their last arrival.
+        :param goods: the goods index.
+        :param cost: cost of each variable of the goods, in order of the variable index.
+        :return: indexes of the path variables in the variable index in travel order, None if there is no path.
+        '''
+
+        lo, hi = np.searchsorted(self.var_location[3], [goods, goods + 1])
+        i, j, t, _ = (v[lo:hi] for v in self.var_location)
+        arrTime = t + self.tranTime[i, j, t]
+        cost = np.array(cost, dtype=float)
+        # legs already dispatched, in travel order
+        pinned = np.zeros(0, dtype=int) if self.pinned is None else np.nonzero(self.pinned[lo:hi])[0]
+        pinned = pinned[np.argsort(t[pinned], kind='stable')]
+        origin = self.kStartPort[goods]
+        if len(pinned):
+            if j[pinned[-1]] == self.kEndPort[goods]:
+                return pinned + lo
+            # search on from the last pinned arrival, never back into a port already visited
+            origin = j[pinned[-1]]
+            cost[(t < arrTime[pinned[-1]]) | np.isin(j, np.append(j[pinned], self.kStartPort[goods]))] = np.inf
+        arrival = np.argsort(arrTime, kind='stable')
+        arrival = arrival[arrTime[arrival] > t[arrival]]
+
+        def relax(var):
+            better = value[var] < label[j[var]]
+            var = var[better]
+            np.minimum.at(label, j[var], value[var])
+            var = var[value[var] == label[j[var]]]
+            labelVar[j[var]] = var
+            return len(var) > 0
+
+        for _ in range(hi - lo):
+            # cheapest cost of arriving at each port so far, and the variable arriving there
+            label = np.full(self.portSpace, np.inf)
+            label[origin] = 0
+            labelVar = np.full(self.portSpace, -1)
+            value = np.full(hi - lo, np.inf)
+            pred = np.full(hi - lo, -1)
+            pointer = 0
+            for d in np.unique(t):
+                # arrivals of earlier departures up to this day
+                end = np.searchsorted(arrTime[arrival], d, side='right')
+                relax(arrival[pointer:end])
+                pointer = end
+                # departures of this day, repeated while same day arrivals improve the labels
+                var = np.nonzero((t == d) & np.isfinite(cost))[0]
+                while True:
+                    value[var] = label[i[var]] + cost[var]
+                    pred[var] = labelVar[i[var]]
+                    if not relax(var[arrTime[var] == d]):
+                        break
+
+            # in a rolling window the path may end at any port where the goods can end the window, or the goods
+            # stays where it is at no cost
+            end = j == self.kEndPort[goods] if self.windowEnd is None else np.isfinite(self.terminalCost[goods, j])
+            var = np.nonzero(end & np.isfinite(value))[0]
+            if self.windowEnd is not None and np.isfinite(self.terminalCost[goods, origin]) and \
+                    (len(var) == 0 or np.min(value[var]) >= 0):
+                return pinned + lo
+            if len(var) == 0:
+                return None
+            path = [var[np.argmin(value[var])]]
+            while pred[path[-1]] >= 0:
+                path.append(pred[path[-1]])
+            path = np.concatenate([pinned, path[::-1]]).astype(int)
+            # ban the first departure into a port already visited
+            visited = np.concatenate([[self.kStartPort[goods]], j[path]])
+            revisit = [n for n in range(len(path)) if visited[n + 1] in visited[:n + 1]]
+            if not revisit:
+                return path + lo
+            cost[path[revisit[0]]] = np.inf
+
+        return None
+
+    def cost_to_go(self):
+        '''return the cost of the rest of the way of each goods from each port to its destination, as goods x ports
+        array: the cheapest path over the lanes for the goods travelling alone, each lane at its cheapest departure
+        of the horizon, without warehouse fee. Infinite from ports without a path.'''
+
+        source, destination, date, _ = self.departures()
+        factor = self.scenario or self.scenario_param({})
+        lane = source * self.portSpace + destination
+        tranCost, tranFixedCost = np.full(self.portSpace ** 2, np.inf), np.full(self.portSpace ** 2, np.inf)
+        np.minimum.at(tranCost, lane,
+                      self.tranCost[source, destination, date] * factor['tranCost'][source, destination])
+        np.minimum.at(tranFixedCost, lane,
+                      self.tranFixedCost[source, destination, date] * factor['tranFixedCost'][source, destination])
+        lane = np.unique(lane)
+        source, destination = np.divmod(lane, self.portSpace)
+        legCost = (np.ceil(self.kVol[:, None] / self.ctnVol[source, destination, 0] - 1e-9) * tranCost[lane] +
+                   tranFixedCost[lane] + np.outer(self.kValue, self.transitDuty[source, destination] *
+                                                  factor['transitDuty'][source, destination]))
+        # shortest paths to the destination over the lanes, never out of the destination
+        cost = np.full((self.goods, self.portSpace), np.inf)
+        cost[range(self.goods), self.kEndPort] = 0
+        for _ in range(self.portSpace):
+            reach = cost.copy()
+            np.minimum.at(reach.T, source, (legCost + cost[:, destination]).T)
+            reach[range(self.goods), self.kEndPort] = 0
+            if np.array_equal(reach, cost):
+                break
+            cost = reach
+
+        return cost
 
     def get_output_(self):
         '''After the model is solved, return total cost, final solution and arrival
@@ -317,70 +1579,402 @@ class MMT:
         return self.objective_value, self.solution_, self.arrTime_
 
     def warehouse_fee(self, x):
-        '''return warehouse fee, arrival time and stay time for each port.'''
+        '''return warehouse fee, arrival time at destination for each goods and stay time for each port and goods.
+        :param x: the flat decision variable vector over the variable index, either solution values or a CVXPY
+        expression.
+        '''
 
-        startTime = np.arange(self.dateSpace).reshape(1, 1, self.dateSpace, 1) * x
-        arrTimeMtrx = startTime + self.tranTime.reshape(self.portSpace, \
-                                                        self.portSpace, self.dateSpace, 1) * x
-        arrTime = arrTimeMtrx.copy()
-        arrTimeMtrx[:, self.kEndPort.tolist(), :, range(self.goods)] = 0
-        stayTime = np.sum(startTime, axis=(1, 2)) - np.sum(arrTimeMtrx, axis=(0, 2))
-        stayTime[self.kStartPort.tolist(), range(self.goods)] -= self.kStartTime
-        warehouseCost = np.sum(np.sum(stayTime * self.kVol, axis=1) * self.whCost)
+        warehouseCost = self.whCostCoef @ x + self.whCostConst
+        arrTime = self.arrTimeOp @ x
+        stayTime = (self.stayTimeOp @ x + self.stayTimeConst).reshape((self.portSpace, self.goods), order='C')
 
         return warehouseCost, arrTime, stayTime
 
+    def set_warehouse_operator(self):
+        '''express stay time, arrival time and warehouse fee as sparse linear operators over the flat x vector, so
+        that both the model and the solution evaluate them as a matrix product.'''
+
+        i, j, t, k = self.var_location
+        col = np.arange(len(k))
+        arrTime = t + self.tranTime[i, j, t]
+        # stay time of goods k at port p (row p * goods + k) is the departure time minus the arrival time,
+        # or minus the order date at origin; stay at destination is not considered. Goods that end a rolling window
+        # at a port stay there until the end of the window, times are then counted from the end of the window
+        end = 0 if self.windowEnd is None else self.windowEnd
+        inTime = arrTime if self.windowEnd is None else np.minimum(arrTime, end)
+        arr = j != self.kEndPort[k]
+        self.stayTimeOp = sp.csr_matrix((np.concatenate([t - end, end - inTime[arr]]),
+                                         (np.concatenate([i * self.goods + k, (j * self.goods + k)[arr]]),
+                                          np.concatenate([col, col[arr]]))),
+                                        shape=(self.portSpace * self.goods, len(k)))
+        self.stayTimeConst = np.zeros(self.portSpace * self.goods)
+        self.stayTimeConst[self.kStartPort * self.goods + np.arange(self.goods)] = end - self.kStartTime
+        # arrival time of goods k at its destination
+        arr = ~arr
+        self.arrTimeOp = sp.csr_matrix((arrTime[arr], (k[arr], col[arr])), shape=(self.goods, len(k)))
+        # warehouse fee is the stay time weighted by warehouse cost of the port and volume of the goods
+        whCost = np.outer(self.whCost, self.kVol).ravel()
+        self.whCostCoef = self.stayTimeOp.T @ whCost
+        self.whCostConst = whCost @ self.stayTimeConst
+
     def txt_solution(self, route, order):
         '''transform the cached results to text.'''
 
         travelMode = dict(zip(zip(route['Source'], route['Destination']), route['Travel Mode']))
-        txt = "Solution"
-        txt += "\nNumber of goods: " + str(order['Order Number'].count())
-        txt += "\nTotal cost: " + str(self.transportCost + self.whCostFinal + self.taxCost)
-        txt += "\nTransportation cost: " + str(self.transportCost)
-        txt += "\nWarehouse cost: " + str(self.whCostFinal)
-        txt += "\nTax cost: " + str(self.taxCost)
+        startDate = [date.isoformat() for date in pd.to_datetime(order['Order Date']).dt.date]
+        commodity = list(order['Commodity'])
+        txt = ["Solution",
+               "Number of goods: " + str(order['Order Number'].count()),
+               "Total cost: " + str(self.transportCost + self.whCostFinal + self.taxCost),
+               "Transportation cost: " + str(self.transportCost),
+               "Warehouse cost: " + str(self.whCostFinal),
+               "Tax cost: " + str(self.taxCost)]
 
         for i in range(order.shape[0]):
-            txt += "\n------------------------------------"
-            txt += "\nGoods-" + str(i + 1) + "  Category: " + order['Commodity'][i]
-            txt += "\nStart date: " + pd.to_datetime(order['Order Date']) \
-                .iloc[i].date().isoformat()
-            txt += "\nArrival date: " + str(self.arrTime_['goods-' + str(i + 1)])
-            txt += "\nRoute:"
-            solution = self.solution_['goods-' + str(i + 1)]
-            route_txt = ''
-            a = 1
-            for j in solution:
-                route_txt += "\n(" + str(a) + ")Date: " + j[2]
-                route_txt += "  From: " + j[0]
-                route_txt += "  To: " + j[1]
-                route_txt += "  By: " + travelMode[(j[0], j[1])]
-                a += 1
-            txt += route_txt
-
-        return txt
-
-
-def transform(filePath):
+            txt.append("------------------------------------")
+            txt.append("Goods-" + str(i + 1) + "  Category: " + commodity[i])
+            txt.append("Start date: " + startDate[i])
+            txt.append("Arrival date: " + str(self.arrTime_['goods-' + str(i + 1)]))
+            txt.append("Route:")
+            for a, j in enumerate(self.solution_['goods-' + str(i + 1)], 1):
+                txt.append("(" + str(a) + ")Date: " + j[2] + "  From: " + j[0] + "  To: " + j[1] +
+                           "  By: " + travelMode[(j[0], j[1])])
+
+        return "\n".join(txt)
+
+
+class ProgressRecorder(ProgressListener):
+    '''a DOCPLEX progress listener that reports the incumbent, best bound, gap and nodes to the stats of the model
+    each time the objective or bound improves during a solve, see MMT.report.'''
+
+    def __init__(self, model):
+        super().__init__(ProgressClock.Gap)
+        self.mmt = model
+
+    def notify_progress(self, data):
+        self.mmt.report('progress', {'time': data.time, 'incumbent': data.current_objective,
+                                     'bound': data.best_bound, 'gap': data.mip_gap, 'nodes': data.current_nb_nodes})
+
+
+class LaneTensor:
+    '''a (start port, end port, date) parameter tensor stored by lane, with one row of dates for each port pair
+    that has a route and a row of default values for all other pairs. It is indexed like a numpy array by (i, j, t),
+    so large route networks where few port pairs are connected do not need the dense ports x ports x dates tensor.'''
+
+    def __init__(self, lane, values):
+        '''
+        :param lane: ports x ports array of the row of each port pair in values.
+        :param values: the tensor values of each lane and date, followed by the row of default values.
+        '''
+        self.lane = lane
+        self.values = values
+        self.shape = lane.shape + values.shape[1:]
+        self.dtype = values.dtype
+
+    def __getitem__(self, index):
+        i, j, t = index
+        return self.values[self.lane[i, j], t]
+
+    def __setitem__(self, index, value):
+        i, j, t = index
+        if not self.values.flags.writeable:
+            # values mapped from the cache are shared, change a copy
+            self.values = np.array(self.values)
+        self.values[self.lane[i, j], t] = value
+
+    def __getstate__(self):
+        return map_state(self.__dict__)
+
+    def __setstate__(self, state):
+        self.__dict__.update(unmap_state(state))
+
+    def toarray(self):
+        '''return the dense tensor.'''
+        return self.values[self.lane]
+
+
+def solve_cluster(model, solver, method, warm_start):
+    '''build and solve the model of a goods cluster in a worker process, return its objective value and flat
+    x, y and z values.'''
+
+    if method == 'mip':
+        model.build_model()
+    model.solve_model(solver, method, warm_start)
+
+    return model.objective_value, model.xs, model.ys, model.zs
+
+
+# the model of a worker process of solve_scenarios, see scenario_worker
+workerModel = None
+
+
+def scenario_worker(model, method):
+    '''keep the model of a worker process of solve_scenarios, built once for all its scenarios.'''
+
+    global workerModel
+    workerModel = model
+    if method == 'mip':
+        workerModel.build_model()
+
+
+def solve_scenario(scenario, solver, method, time_limit, mip_gap):
+    '''solve a scenario with the model of the worker process and return its cost breakdown.'''
+
+    start = time.perf_counter()
+    row = dict.fromkeys(['Transportation cost', 'Warehouse cost', 'Tax cost', 'Total cost'], np.nan)
+    error = None
+    workerModel.set_scenario(scenario)
+    try:
+        workerModel.solve_model(solver, method, time_limit=time_limit, mip_gap=mip_gap)
+        row.update({'Transportation cost': workerModel.transportCost, 'Warehouse cost': workerModel.whCostFinal,
+                    'Tax cost': workerModel.taxCost, 'Total cost': workerModel.transportCost +
+                    workerModel.whCostFinal + workerModel.taxCost})
+    except Exception as e:
+        error = repr(e)
+    row.update({'Time': time.perf_counter() - start, 'Error': error})
+
+    return row
+
+
+class MappedArray:
+    '''the pickled form of an array memory-mapped from a .npy file, which maps the same file again when unpickled.'''
+
+    def __init__(self, array):
+        self.filename = array.filename
+
+    def load(self):
+        return np.load(self.filename, mmap_mode='r')
+
+
+def map_state(state):
+    '''return an object state for pickling where the memory-mapped arrays are replaced by their file, so that worker
+    processes share the mapped file instead of receiving a copy.'''
+    return {name: MappedArray(value) if isinstance(value, np.memmap) and value.filename else value
+            for name, value in state.items()}
+
+
+def unmap_state(state):
+    '''map the files of an unpickled object state again, see map_state.'''
+    return {name: value.load() if isinstance(value, MappedArray) else value for name, value in state.items()}
+
+
+def content_hash(*items):
+    '''return a hash of the content of data frames, bytes and other values, used as cache key.'''
+    digest = hashlib.sha256()
+    for item in items:
+        if isinstance(item, pd.DataFrame):
+            digest.update(repr(list(item.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(item, index=False).values.tobytes())
+        elif isinstance(item, bytes):
+            digest.update(item)
+        else:
+            digest.update(repr(item).encode())
+    return digest.hexdigest()
+
+
+def save_arrays(path, arrays):
+    '''save a dict of arrays as .npy files named by the path and their keys and return them mapped, see load_arrays.
+    Files are written under a temporary name first, so that concurrent processes never map a partial file.'''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    for name, value in arrays.items():
+        temp = '%s.%s.%d.tmp' % (path, name, os.getpid())
+        with open(temp, 'wb') as file:
+            np.save(file, value)
+        os.replace(temp, '%s.%s.npy' % (path, name))
+    return load_arrays(path, list(arrays))
+
+
+def load_arrays(path, names):
+    '''return the arrays saved by save_arrays memory-mapped read-only, None if any of them is not saved.'''
+    files = ['%s.%s.npy' % (path, name) for name in names]
+    if not all(os.path.exists(file) for file in files):
+        return None
+    return {name: np.load(file, mmap_mode='r') for name, file in zip(names, files)}
+
+
+def read_table(filePath, name):
+    '''read a table from a Parquet, Feather or CSV file by its extension, otherwise from the sheet of an Excel
+    workbook.'''
+    extension = os.path.splitext(filePath)[1].lower()
+    if extension == '.parquet':
+        return pd.read_parquet(filePath)
+    if extension == '.feather':
+        return pd.read_feather(filePath)
+    if extension == '.csv':
+        return pd.read_csv(filePath)
+    return pd.read_excel(filePath, sheet_name=name)
+
+
+def transform_tables(order, route):
+    '''transform the order and route information tables, as in the sheets of "model data.xlsx", into the form that
+    is processed by the operation research model, see transform.'''
+    for column in ['Order Date', 'Required Delivery Date']:
+        order[column] = pd.to_datetime(order[column])
+    order.loc[order['Journey Type'] == 'Domestic', 'Tax Percentage'] = 0
+    route['Cost'] = route[['Port/Airport/Rail Handling Cost', 'Bunker/ Fuel Cost', 'Documentation Cost',
+                           'Equipment Cost', 'Extra Cost']].sum(axis=1)
+    route['Time'] = np.ceil(route[['CustomClearance time (hours)', 'Port/Airport/Rail Handling time (hours)',
+                                   'Extra Time', 'Transit time (hours)']].sum(axis=1) / 24)
+    weekdays = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    feasibility = route[weekdays].to_numpy()
+    route = route[['Route Number', 'Source', 'Destination', 'Container Size', 'Fixed Freight Cost', 'Time', 'Cost',
+                   'Warehouse Cost', 'Travel Mode', 'Transit Duty']]
+    route = route.astype({column: 'category' for column in ['Source', 'Destination', 'Travel Mode']})
+    # one row for each weekday of each route, weekday by weekday
+    route = route.iloc[np.tile(np.arange(route.shape[0]), len(weekdays))].reset_index(drop=True)
+    route['Weekday'] = np.repeat(np.arange(1, len(weekdays) + 1, dtype=np.int8), feasibility.shape[0])
+    route['Feasibility'] = feasibility.T.ravel()
+
+    return order, route
+
+
+def transform(filePath, cache_dir=None):
     '''Read in order and route data, transform the data into a form that can
-    be processed by the operation research model.'''
-    order = pd.read_excel(filePath, sheet_name='Order Information')
-    route = pd.read_excel(filePath, sheet_name='Route Information')
-    order['Tax Percentage'][order['Journey Type'] == 'Domestic'] = 0
-    route['Cost'] = route[route.columns[7:12]].sum(axis=1)
-    route['Time'] = np.ceil(route[route.columns[14:18]].sum(axis=1) / 24)
-    route = route[list(route.columns[0:4]) + ['Fixed Freight Cost', 'Time', \
-                                              'Cost', 'Warehouse Cost', 'Travel Mode', 'Transit Duty'] + list(
-        route.columns[-9:-2])]
-    route = pd.melt(route, id_vars=route.columns[0:10], value_vars=route.columns[-7:] \
-                    , var_name='Weekday', value_name='Feasibility')
-    route['Weekday'] = route['Weekday'].replace({'Monday': 1, 'Tuesday': 2, 'Wednesday': 3, \
-                                                 'Thursday': 4, 'Friday': 5, 'Saturday': 6, 'Sunday': 7})
+    be processed by the operation research model.
+    :param filePath: an Excel workbook with the 'Order Information' and 'Route Information' sheets, or a directory
+    with the two tables as 'Order Information' and 'Route Information' Parquet, Feather or CSV files.
+    :param cache_dir: directory where the transformed data are cached under the hash of the input files, so that
+    later calls on unchanged input skip parsing.
+    '''
+    names = ['Order Information', 'Route Information']
+    if os.path.isdir(filePath):
+        files = [next((path for path in (os.path.join(filePath, name + extension)
+                                         for extension in ['.parquet', '.feather', '.csv']) if os.path.exists(path)),
+                      None) for name in names]
+        if None in files:
+            raise FileNotFoundError('No Parquet, Feather or CSV file of %s in %s'
+                                    % (' and '.join(n for n, f in zip(names, files) if f is None), filePath))
+    elif os.path.splitext(filePath)[1].lower() in ['.parquet', '.feather', '.csv']:
+        raise ValueError('%s holds a single table, a directory with the %s tables as Parquet, Feather or CSV files '
+                         'is expected' % (filePath, ' and '.join(names)))
+    else:
+        files = [filePath] * len(names)
+
+    cache = None
+    if cache_dir is not None:
+        data = []
+        for file in sorted(set(files)):
+            with open(file, 'rb') as f:
+                data.append(f.read())
+        cache = os.path.join(cache_dir, 'data-' + content_hash(*data) + '.pkl')
+        if os.path.exists(cache):
+            return pd.read_pickle(cache)
+
+    order, route = (read_table(file, name) for file, name in zip(files, names))
+    order, route = transform_tables(order, route)
+
+    if cache is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp = '%s.%d.tmp' % (cache, os.getpid())
+        pd.to_pickle((order, route), temp)
+        os.replace(temp, cache)
 
     return order, route
 
 
+def generate_instance(cities=4, ports=4, lanes=None, frequency=3, days=30, goods=8, seed=0, startDate='2018-02-01'):
+    '''generate a random instance, as the order and route information returned by transform.
+    Every city has a warehouse and other ports (seaport, airport, railway station, then terminals), each linked to
+    the warehouse by daily trucks both ways. The warehouses of neighbouring cities are linked by daily trucks in a
+    ring, so that every goods can be delivered in time, and the other lanes between cities link ports of the same
+    kind and depart on random weekdays. Goods are shipped between the warehouses of two cities.
+    :param cities: number of cities, at least 2.
+    :param ports: number of ports in each city, including the warehouse.
+    :param lanes: number of lanes between cities besides the warehouse ring, default to all the lanes between ports
+    of the same kind.
+    :param frequency: number of weekdays with departures on the lanes between cities.
+    :param days: length of the horizon, from the first order date to the last deadline.
+    :param goods: number of goods.
+    :param seed: seed of the random generator.
+    :param startDate: first order date.
+    :return: order and route information.
+    '''
+    if cities < 2:
+        raise ValueError('At least 2 cities are needed to ship goods between')
+    rng = np.random.default_rng(seed)
+    kinds = (['Warehouse', 'Port', 'Airport', 'Railway Station'] +
+             ['Terminal ' + str(n) for n in range(1, ports - 3)])[:ports]
+    modes = ['Truck', 'Sea', 'Air', 'Rail'] + ['Truck'] * (ports - 4)
+    # container size, transit hours, cost per container and fixed cost range of each travel mode
+    modeParam = {'Truck': (34, (4, 20), (100, 300), (80, 150)), 'Sea': (67, (24, 120), (200, 600), (50, 300)),
+                 'Air': (7, (2, 8), (1000, 3000), (150, 2000)), 'Rail': (34, (24, 96), (300, 800), (80, 100))}
+    city = ['City ' + str(c + 1) for c in range(cities)]
+    country = np.array(['Country ' + str(c // 2 + 1) for c in range(cities)])
+    whCost = rng.integers(5, 26, cities)
+
+    # (source city, source port, destination city, destination port) of the daily and the weekly lanes
+    daily = [(c, 0, c, p) for c in range(cities) for p in range(1, ports)] + \
+            [(c, p, c, 0) for c in range(cities) for p in range(1, ports)]
+    ring = sorted({(c, (c + 1) % cities) for c in range(cities)} | {((c + 1) % cities, c) for c in range(cities)})
+    daily += [(a, 0, b, 0) for a, b in ring]
+    weekly = [(a, p, b, p) for a in range(cities) for b in range(cities) for p in range(ports)
+              if a != b and not (p == 0 and (a, b) in ring)]
+    if lanes is not None:
+        weekly = [weekly[n] for n in sorted(rng.choice(len(weekly), min(lanes, len(weekly)), replace=False))]
+    feasibility = np.zeros((len(daily) + len(weekly), 7), dtype=int)
+    feasibility[:len(daily)] = 1
+    for n in range(len(daily), len(feasibility)):
+        feasibility[n, rng.choice(7, min(frequency, 7), replace=False)] = 1
+
+    lane = np.array(daily + weekly, dtype=int).reshape(-1, 4)
+    mode = [modes[p] if a != b else 'Truck' for a, p, b, _ in lane]
+    size, hours, cost, fixedCost = (np.array([modeParam[m][n] for m in mode]) for n in range(4))
+    draw = lambda bounds: rng.integers(bounds[:, 0], bounds[:, 1] + 1)
+    cost = draw(cost)
+    route = pd.DataFrame({'Route Number': np.arange(1, len(lane) + 1),
+                          'Source': [city[a] + ' ' + kinds[p] for a, p in lane[:, :2]],
+                          'Destination': [city[b] + ' ' + kinds[p] for b, p in lane[:, 2:]],
+                          'Container Size': size,
+                          'Carrier': 'Carrier',
+                          'Travel Mode': mode,
+                          'Fixed Freight Cost': draw(fixedCost),
+                          'Port/Airport/Rail Handling Cost': cost // 2,
+                          'Bunker/ Fuel Cost': cost - cost // 2,
+                          'Documentation Cost': 0,
+                          'Equipment Cost': 0,
+                          'Extra Cost': 0,
+                          'Warehouse Cost': np.where(lane[:, 1] == 0, whCost[lane[:, 0]], np.nan),
+                          'Transit Duty': np.where(lane[:, 0] == lane[:, 2], 0,
+                                                   rng.choice([0, 0.001, 0.002], len(lane))),
+                          'CustomClearance time (hours)': 0,
+                          'Port/Airport/Rail Handling time (hours)': 0,
+                          'Extra Time': 0,
+                          'Transit time (hours)': draw(hours).astype(float)})
+    for n, weekday in enumerate(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']):
+        route[weekday] = feasibility[:, n]
+
+    # goods go between two cities, with a deadline that leaves a day for each warehouse hop on the ring
+    source = rng.integers(0, cities, goods)
+    destination = (source + rng.integers(1, cities, goods)) % cities
+    hop = np.abs(source - destination)
+    lead = np.minimum(hop, cities - hop) + 1
+    if np.max(lead) > days:
+        raise ValueError('Horizon too short to deliver the goods between the farthest cities')
+    orderDate = rng.integers(0, days - lead + 1)
+    deadline = orderDate + lead + rng.integers(0, days - orderDate - lead + 1)
+    # the horizon spans exactly the given days
+    orderDate[0], deadline[0] = 0, days
+    volume = rng.choice([7, 34, 50, 67], goods)
+    order = pd.DataFrame({'Order Number': np.arange(1, goods + 1),
+                          'Ship From': [city[c] + ' Warehouse' for c in source],
+                          'Ship To': [city[c] + ' Warehouse' for c in destination],
+                          'Commodity': ['Commodity ' + str(n) for n in rng.integers(1, 21, goods)],
+                          'Order Value': rng.integers(10, 801, goods) * 1000,
+                          'Weight (KG)': volume * 300,
+                          'Volume': volume,
+                          'Shipper Name': 'Shipper',
+                          'Shipper Address': 'Address',
+                          'Shipper Country': country[source],
+                          'Consignee Country': country[destination],
+                          'Order Date': pd.Timestamp(startDate) + pd.to_timedelta(orderDate, unit='D'),
+                          'Required Delivery Date': pd.Timestamp(startDate) + pd.to_timedelta(deadline, unit='D'),
+                          'Journey Type': np.where(country[source] == country[destination], 'Domestic',
+                                                   'International'),
+                          'Tax Percentage': rng.choice([0.01, 0.03, 0.1, 0.15], goods)})
+
+    return transform_tables(order, route)
+
+
 if __name__ == '__main__':
     order, route = transform("model data.xlsx")
     m = MMT()
@@ -0,0 +1,73 @@
+'''
+Checks of the multi-modal transportation model: the objective of the sample data by every method that needs no built
+model, and the in-place changes of a built DOCPLEX model against a model built afresh on the changed data. The
+DOCPLEX instance is kept under the size limits of the CPLEX community edition. Run with
+
+    python -m pytest test_model.py
+'''
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the model script is loaded by path, as its file name is not a module name
+directory = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location('mmt', os.path.join(directory, 'multi-modal transportation.py'))
+mmt = importlib.util.module_from_spec(spec)
+sys.modules['mmt'] = mmt
+spec.loader.exec_module(mmt)
+
+# optimal objective of "model data.xlsx", see Solution.txt
+sampleObjective = 196959
+
+
+@pytest.mark.parametrize('method', ['heuristic', 'relaxation', 'milp'])
+def test_sample_objective(method):
+    order, route = mmt.transform(os.path.join(directory, 'model data.xlsx'))
+    model = mmt.MMT('CVXPY')
+    model.set_param(route, order)
+    model.solve_model(method=method)
+    assert model.objective_value == pytest.approx(sampleObjective)
+
+
+def solved(order, route):
+    '''return a DOCPLEX model built and solved afresh.'''
+    model = mmt.MMT('DOCPLEX')
+    model.set_param(route, order)
+    model.build_model()
+    model.solve_model()
+    return model
+
+
+def assert_same(model, order, route):
+    '''assert that a model changed in place has the variable index and optimum of a model built on the data.'''
+    fresh = solved(order, route)
+    assert all(np.array_equal(a, b) for a, b in zip(model.var_location, fresh.var_location))
+    assert model.objective_value == pytest.approx(fresh.objective_value)
+
+
+def test_in_place_changes():
+    order, route = mmt.generate_instance(cities=4, ports=3, days=10, goods=5, seed=2)
+    model = solved(order, route)
+
+    model.remove_orders([1])
+    model.solve_model()
+    changed = order.drop(index=order.index[1])
+    assert_same(model, changed, route)
+
+    model.add_orders(order.iloc[[1]])
+    model.solve_model()
+    changed = pd.concat([changed, order.iloc[[1]]])
+    assert_same(model, changed, route)
+
+    # cancel the route of the first leg of the plan, so that the goods are re-routed
+    i, j = (location[model.solution_legs()[0]] for location in model.var_location[:2])
+    source, destination = model.portIndex[i], model.portIndex[j]
+    previous = model.objective_value
+    model.disable_route(source, destination)
+    model.solve_model()
+    assert model.objective_value > previous
+    assert_same(model, changed, route[(route['Source'] != source) | (route['Destination'] != destination)])